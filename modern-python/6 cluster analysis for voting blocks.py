@@ -14,65 +14,67 @@
 # ---
 
 # +
-import csv
-import glob
-
-from typing import NamedTuple, DefaultDict, Dict, List, Tuple
+from typing import DefaultDict, Dict, List
 from collections import defaultdict, Counter
 from pprint import pprint
-# -
 
-NUM_SENATORS = 100
+from congress_loader import Senator, VoteHistory, VoteInfo
+from kmeans import deduplicate
+from vote_cache import load_matrix
+from voting_blocks import fit
+# -
 
-Senator = NamedTuple('Senator', [('name', str), ('party', str), ('state', str)])
-VoteValue = int
-VoteHistory = Tuple[VoteValue, ...]
+# # Load votes
+#
+# The CSV files are parsed and merged in vote-number order, then cached as a binary matrix
+# (congress_data.votes) that later runs memory-map instead of parsing again. `workers=1` keeps the work in
+# this process: a notebook or script run at module level has no `__main__` guard for a process pool
 
-vote_value = {'Yea': 1, 'Nay': -1, 'Not Voting': 0} # type: Dict[str, VoteValue]
+matrix = load_matrix('congress_data', workers=1)
+roll_calls = matrix.votes  # type: List[VoteInfo]
 
-accumulated_record = defaultdict(list) # type: DefaultDict[Senator, List[VoteValue]]
+# # Transform the record into a plain dict that maps to tuple of votes
+#
+# Every history has one entry per roll call; a senator who was not in office for a vote has ABSENT there
 
-# # Load votes
+record = matrix.record()  # type: Dict[Senator, VoteHistory]
 
-for filename in glob.glob('congress_data/*.csv'):    
-    with open(filename, encoding='utf-8') as f:
-        reader = csv.reader(f)
-        vote_topic = next(reader)
-        headers = next(reader)
-        for person, state, distric, vote, name, party in reader:
-            senator = Senator(name, party, state)
-            accumulated_record[senator].append(vote_value[vote])
+# # Collapse identical vote histories
+#
+# Party-line voters share the exact same history: cluster each unique history once, weighted by how many
+# senators cast it. `inverse[i]` is the index of the i-th senator's history in `unique_votes`.
 
-# # Transform the record into a plain dict that maps to tuple of votes
+senators = list(record)  # type: List[Senator]
+unique_votes, counts, inverse = deduplicate(record.values())
 
-record = {senator: tuple(votes) for senator, votes in accumulated_record.items()}  # type: Dict[Senator, VoteHistory]
+print(f'{len(senators)} senators, {len(unique_votes)} distinct vote histories')
 
 # # Use k-means to locate the cluster centroids, assign each senator to the nearest cluster
+#
+# `fit` imports the backend it needs on first use: with senator turnover (ABSENT votes) that is the NumPy
+# backend, whose distances and centroids skip the votes a senator wasn't there for; otherwise plain Python
 
-from kmeans import k_means, assign_data
-
-centroids = k_means(record.values(), k=3)
+# +
+result = fit(unique_votes, counts, k=3, seed=0, workers=1)  # 10 restarts over a few dozen rows: no pool needed
 
-clustered_votes = assign_data(centroids, record.values())
+print(f'k-means stopped after {result.iterations} iterations (converged: {result.converged})')
+# -
 
-# # Build a reverse mapping from a vote history to a list of senators who voted that way
+# # Map the clusters back to the senators through the integer index
 
-votes_to_senators = defaultdict(list)  # type: DefaultDict[VoteHistory, List[Senator]]
+clusters = defaultdict(list)  # type: DefaultDict[int, List[Senator]]
 
-for senator, votehistory in record.items():
-    votes_to_senators[votehistory].append(senator)
+for senator, row in zip(senators, inverse):
+    clusters[int(result.labels[row])].append(senator)
 
-assert sum([len(cluster) for cluster in votes_to_senators.values()]) == NUM_SENATORS
+assert sum([len(cluster) for cluster in clusters.values()]) == len(record)
 
 # # Display the clusters and the members (senators) of each cluster
 
-for i, votes_in_cluster in enumerate(clustered_votes.values(), start=1):
+for i, members in enumerate(clusters.values(), start=1):
     print(f'----- Voting Cluster #{i} -----')
     party_totals = Counter()
-    for votes in set(votes_in_cluster):
-        for senator in votes_to_senators[votes]:
-            print(senator)
-            party_totals[senator.party] += 1
+    for senator in members:
+        print(senator)
+        party_totals[senator.party] += 1
     print(party_totals)
-
-
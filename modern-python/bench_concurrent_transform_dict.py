@@ -0,0 +1,291 @@
+'''Stress test and throughput benchmark of transform_dict.ConcurrentTransformDict under threads
+
+Stress: writer threads keep reassigning the keys with random letter case,
+storing each spelling as its own value, and deleting and re-adding some;
+reader threads call getitem() and check that the original key and the
+value they get back come from the same write, and an iterating thread
+walks items(), all on a small set of hot keys. The counts of torn reads
+(key of one write, value of another) and of errors raised by iteration
+must be zero for ConcurrentTransformDict; TransformDict is run the same
+way for contrast. Each runs with str.casefold and with a transform whose
+keys hash and compare in Python (FoldedKey): with the GIL, a thread can
+only be switched out where Python code runs, so plain str keys hardly
+ever hit the gap between TransformDict's two writes, but Python-level
+hashing (or a free-threaded build) does.
+
+A get_or_create round checks that the factory runs once per key however
+many threads miss at once. The switch interval is lowered during the
+stress runs so threads interleave as often as possible.
+
+Throughput: total getitem/setitem operations per second for 1, 2, 4, ...
+threads with a read-heavy mix, for TransformDict (unsafe, the floor),
+TransformDict behind one global lock (the naive fix) and
+ConcurrentTransformDict. With the GIL, threads do not run Python code in
+parallel and the interesting number is the overhead; on a free-threaded
+build the striped locks let writers to different keys proceed together.
+
+    python bench_concurrent_transform_dict.py --seconds 2 --save before.json
+'''
+
+from typing import Callable, Dict, List
+from collections import Counter
+from random import Random
+from threading import Barrier, Event, Lock, Thread
+from time import perf_counter, sleep
+import argparse
+import json
+import os
+import platform
+import sys
+
+from bench_transform_dict import make_keys, respell
+from transform_dict import ConcurrentTransformDict, TransformDict
+
+
+class LockedTransformDict(TransformDict):
+    'TransformDict with every access used here behind one lock: the naive way to share it'
+
+    def __init__(self, func, *args, **kwargs):
+        self.lock = Lock()
+        super().__init__(func, *args, **kwargs)
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            super().__setitem__(key, value)
+
+    def getitem(self, key):
+        with self.lock:
+            return super().getitem(key)
+
+
+class FoldedKey(str):
+    'A casefolded str that hashes and compares in Python code, like most user-defined keys'
+
+    def __hash__(self):
+        return str.__hash__(self)
+
+    def __eq__(self, other):
+        return str.__eq__(self, other)
+
+
+def folded_key(key: str) -> FoldedKey:
+    return FoldedKey(key.casefold())
+
+
+TRANSFORMS = {'str.casefold': str.casefold, 'FoldedKey': folded_key}
+
+
+def run_threads(targets: List[Callable[[Event], Dict[str, int]]], seconds: float) -> Counter:
+    'Start every target(stop) together, stop them after seconds and add up the counts they return'
+    stop = Event()
+    start = Barrier(len(targets) + 1)
+    totals = Counter()
+    lock = Lock()
+
+    def worker(target):
+        start.wait()
+        counts = target(stop)
+        with lock:
+            totals.update(counts)
+
+    threads = [Thread(target=worker, args=(target,)) for target in targets]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return totals
+
+
+def writer(d, keys: List[str], seed: int) -> Callable[[Event], Dict[str, int]]:
+    def target(stop):
+        rng = Random(seed)
+        writes = 0
+        while not stop.is_set():
+            key = respell(rng.choice(keys), rng)
+            if rng.random() < 0.05:
+                d.pop(key, None)
+            d[key] = key
+            writes += 1
+        return {'writes': writes}
+    return target
+
+
+def reader(d, keys: List[str], seed: int) -> Callable[[Event], Dict[str, int]]:
+    def target(stop):
+        rng = Random(seed)
+        reads = torn = missing = 0
+        while not stop.is_set():
+            try:
+                original, value = d.getitem(rng.choice(keys))
+            except KeyError:
+                missing += 1  # popped by a writer, not re-added yet
+                continue
+            reads += 1
+            torn += original != value
+        return {'reads': reads, 'torn reads': torn, 'missing': missing}
+    return target
+
+
+def iterator(d) -> Callable[[Event], Dict[str, int]]:
+    def target(stop):
+        walks = errors = 0
+        while not stop.is_set():
+            try:
+                for key, value in d.items():
+                    pass
+                walks += 1
+            except (RuntimeError, KeyError):  # changed size during iteration, or popped mid-walk
+                errors += 1
+        return {'iterations': walks, 'iteration errors': errors}
+    return target
+
+
+def stress(cls, transform, keys: List[str], threads: int, seconds: float, seed: int) -> Dict[str, int]:
+    d = cls(transform, [(key, key) for key in keys])
+    targets = [writer(d, keys, seed + i) for i in range(threads)]
+    targets += [reader(d, keys, seed + threads + i) for i in range(threads)]
+    targets.append(iterator(d))
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        return dict(run_threads(targets, seconds))
+    finally:
+        sys.setswitchinterval(interval)
+
+
+def stress_get_or_create(keys: List[str], threads: int, seed: int) -> Dict[str, int]:
+    'Every thread asks for every key, in its own order and spelling: the factory must run once per key'
+    d = ConcurrentTransformDict(str.casefold)
+    calls = Counter()
+    start = Barrier(threads)
+
+    def factory(key):
+        calls[key.casefold()] += 1  # serialised per key by the stripe lock
+        return key.casefold()
+
+    def worker(seed):
+        rng = Random(seed)
+        order = rng.sample(keys, len(keys))
+        start.wait()
+        for key in order:
+            assert d.get_or_create(respell(key, rng), factory) == key.casefold()
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        workers = [Thread(target=worker, args=(seed + i,)) for i in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    return {'keys': len(keys), 'factory calls': sum(calls.values()), 'entries': len(d)}
+
+
+def throughput(cls, keys: List[str], threads: int, seconds: float, seed: int,
+               write_fraction: float) -> float:
+    'getitem/setitem operations per second over all threads'
+    d = cls(str.casefold, [(key, key) for key in keys])
+
+    def worker(seed):
+        def target(stop):
+            rng = Random(seed)
+            queries = [respell(rng.choice(keys), rng) for i in range(1000)]
+            writes = [rng.random() < write_fraction for i in range(1000)]
+            ops = 0
+            while not stop.is_set():
+                for key, write in zip(queries, writes):
+                    if write:
+                        d[key] = key
+                    else:
+                        d.getitem(key)
+                ops += len(queries)
+            return {'ops': ops}
+        return target
+
+    start = perf_counter()
+    totals = run_threads([worker(seed + i) for i in range(threads)], seconds)
+    return totals['ops'] / (perf_counter() - start)
+
+
+def run(n: int, hot: int, threads: int, seconds: float, seed: int, write_fraction: float) -> dict:
+    keys = make_keys(n, seed)
+    results = {'stress': {}, 'throughput': {}}
+    for cls in [TransformDict, ConcurrentTransformDict]:
+        for name, transform in TRANSFORMS.items():
+            results['stress'][f'{cls.__name__}({name})'] = stress(cls, transform, keys[:hot], threads,
+                                                                 seconds, seed)
+    results['stress']['get_or_create'] = stress_get_or_create(keys[:1000], threads, seed)
+    counts = []
+    count = 1
+    while count <= threads:
+        counts.append(count)
+        count *= 2
+    for cls in [TransformDict, LockedTransformDict, ConcurrentTransformDict]:
+        results['throughput'][cls.__name__] = {
+            str(count): throughput(cls, keys, count, seconds, seed, write_fraction) for count in counts}
+    return {
+        'params': {'keys': n, 'hot': hot, 'threads': threads, 'seconds': seconds, 'seed': seed,
+                   'write_fraction': write_fraction},
+        'python': platform.python_version(),
+        'gil': getattr(sys, '_is_gil_enabled', lambda: True)(),
+        'cpus': os.cpu_count(),
+        'machine': platform.machine(),
+        'stress': results['stress'],
+        'throughput': results['throughput'],
+    }
+
+
+def report(result: dict, baseline: dict=None) -> None:
+    print(' '.join(f'{key}={value}' for key, value in result['params'].items()),
+          f'gil={result["gil"]} cpus={result["cpus"]}')
+    for name, counts in result['stress'].items():
+        print(f'stress {name:<38}', '  '.join(f'{key}={value}' for key, value in counts.items()))
+    print()
+    header = f'{"ops/s":<24}' + ''.join(f'{count + " threads":>14}' for count in
+                                        next(iter(result['throughput'].values())))
+    print(header + ('  speedup' if baseline else ''))
+    for name, rates in result['throughput'].items():
+        line = f'{name:<24}' + ''.join(f'{rate:>14,.0f}' for rate in rates.values())
+        old = baseline and baseline['throughput'].get(name)
+        if old:
+            line += '  ' + ' '.join(f'{rate / old[count]:.2f}x' for count, rate in rates.items() if count in old)
+        print(line)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--keys', type=int, default=10000)
+    parser.add_argument('--hot', type=int, default=16, help='number of keys in the stress runs')
+    parser.add_argument('--threads', type=int, default=8, help='writer and reader threads each, at most')
+    parser.add_argument('--seconds', type=float, default=1.0, help='length of each run')
+    parser.add_argument('--writes', type=float, default=0.1, help='fraction of writes in the throughput mix')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', metavar='FILE', help='write the results as JSON')
+    parser.add_argument('--compare', metavar='FILE', help='JSON results of an earlier run')
+    args = parser.parse_args(argv)
+
+    result = run(args.keys, args.hot, args.threads, args.seconds, args.seed, args.writes)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['params'] != result['params']:
+            print(f'warning: baseline params differ: {baseline["params"]}', file=sys.stderr)
+    report(result, baseline)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2)
+    failed = [name for name, counts in result['stress'].items() if name.startswith('Concurrent')
+              and (counts['torn reads'] or counts['iteration errors'])]
+    created = result['stress']['get_or_create']
+    if failed or created['factory calls'] != created['keys']:
+        sys.exit('ConcurrentTransformDict failed the stress test')
+
+
+if __name__ == "__main__":
+    main()
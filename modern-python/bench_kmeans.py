@@ -0,0 +1,149 @@
+'''Benchmarks for kmeans.py
+
+Times each stage of k-means on synthetic data and reports distance
+evaluations per second and peak memory (tracemalloc). Results are saved
+as JSON so two runs can be compared, e.g. before and after a backend
+change:
+
+    python bench_kmeans.py --points 20000 --dims 20 --k 8 --save before.json
+    python bench_kmeans.py --points 20000 --dims 20 --k 8 --compare before.json
+
+With --votes DIR the points are the senators' vote histories read from
+the congress_data CSV files instead of synthetic blobs.
+
+The "dist-globals" stage is ``dist`` without the ``fsum=fsum, sqrt=sqrt,
+zip=zip`` default arguments, to measure the bind-as-locals trick.
+'''
+
+from typing import Callable, Dict, List, Optional
+from math import fsum, sqrt
+from random import Random
+from time import perf_counter
+import argparse
+import json
+import platform
+import sys
+import tracemalloc
+
+import kmeans
+from kmeans import Point, dist
+from congress_loader import load_record
+
+
+def dist_globals(p: Point, q: Point) -> float:
+    'kmeans.dist without binding fsum, sqrt and zip as locals'
+    return sqrt(fsum([(x - y) ** 2 for x, y in zip(p, q)]))
+
+
+def make_blobs(n: int, dims: int, k: int, seed: int=0, spread: float=5.0) -> List[Point]:
+    'n points scattered around k random centres in [0, 100)^dims'
+    rng = Random(seed)
+    centres = [[rng.uniform(0, 100) for d in range(dims)] for c in range(k)]
+    return [tuple(rng.gauss(x, spread) for x in rng.choice(centres)) for i in range(n)]
+
+
+def best_time(func: Callable[[], object], repeat: int) -> float:
+    'Fastest wall-clock time of repeat calls'
+    times = []
+    for i in range(repeat):
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def peak_memory(func: Callable[[], object]) -> int:
+    'Peak bytes allocated by one call (timed separately: tracemalloc slows everything down)'
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def stages(data: List[Point], k: int, iterations: int, seed: int) -> Dict[str, tuple]:
+    'name -> (function to time, distance evaluations per call)'
+    centroids = Random(seed).sample(data, k)
+    labeled = kmeans.assign_data(centroids, data)
+    groups = list(labeled.values())
+    pairs = [(p, q) for p in data for q in centroids]
+    n = len(data)
+    return {
+        'dist': (lambda: [dist(p, q) for p, q in pairs], n * k),
+        'dist-globals': (lambda: [dist_globals(p, q) for p, q in pairs], n * k),
+        'assign_data': (lambda: kmeans.assign_data(centroids, data), n * k),
+        'compute_centroids': (lambda: kmeans.compute_centroids(groups), 0),
+        'k_means': (lambda: kmeans.k_means_fit(data, k, iterations, seed=seed), None),
+    }
+
+
+def run(points: int, dims: int, k: int, iterations: int, repeat: int, seed: int,
+        votes: Optional[str]=None) -> dict:
+    if votes:
+        data = list(load_record(votes)[0].values())
+        points, dims = len(data), len(data[0])
+    else:
+        data = make_blobs(points, dims, k, seed)
+    results = {}
+    for name, (func, evaluations) in stages(data, k, iterations, seed).items():
+        seconds = best_time(func, repeat)
+        if evaluations is None:
+            # k_means stops early, so count the iterations it actually ran
+            evaluations = points * k * kmeans.k_means_fit(data, k, iterations, seed=seed).iterations
+        results[name] = {
+            'seconds': seconds,
+            'dist_per_second': evaluations / seconds if evaluations else None,
+            'peak_bytes': peak_memory(func),
+        }
+    return {
+        'params': {'data': votes or 'blobs', 'points': points, 'dims': dims, 'k': k,
+                   'iterations': iterations, 'repeat': repeat, 'seed': seed},
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'stages': results,
+    }
+
+
+def report(result: dict, baseline: dict=None) -> None:
+    print(' '.join(f'{key}={value}' for key, value in result['params'].items()))
+    header = f'{"stage":<18} {"seconds":>10} {"dist/s":>12} {"peak KiB":>10}'
+    print(header + ('  speedup' if baseline else ''))
+    for name, stage in result['stages'].items():
+        rate = stage['dist_per_second']
+        line = (f'{name:<18} {stage["seconds"]:>10.4f} {rate and f"{rate:,.0f}" or "-":>12} '
+                f'{stage["peak_bytes"] / 1024:>10,.0f}')
+        old = baseline and baseline['stages'].get(name)
+        if old:
+            line += f'  {old["seconds"] / stage["seconds"]:>6.2f}x'
+        print(line)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=5000)
+    parser.add_argument('--dims', type=int, default=10)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--votes', metavar='DIR', help='cluster the congress_data CSV files in DIR')
+    parser.add_argument('--save', metavar='FILE', help='write the results as JSON')
+    parser.add_argument('--compare', metavar='FILE', help='JSON results of an earlier run')
+    args = parser.parse_args(argv)
+
+    result = run(args.points, args.dims, args.k, args.iterations, args.repeat, args.seed, args.votes)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['params'] != result['params']:
+            print(f'warning: baseline params differ: {baseline["params"]}', file=sys.stderr)
+    report(result, baseline)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
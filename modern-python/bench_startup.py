@@ -0,0 +1,126 @@
+'''Startup benchmark: import time of each module and time to first cluster
+
+Every measurement runs in a fresh interpreter, the way a short-lived
+worker process pays for it. For each module the child process reports
+the time ``import module`` took and how many modules it pulled into
+sys.modules; "first cluster" is importing voting_blocks and getting the
+first cluster out of ``analyze()`` (the vote cache is warmed first, so
+this measures start-up, not CSV parsing). The wall-clock column is the
+whole process, interpreter start and exit included.
+
+    python bench_startup.py --save before.json
+    python bench_startup.py --compare before.json
+'''
+
+from typing import Dict, List, Optional
+from time import perf_counter
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+
+modules = ['kmeans', 'kmeans_elkan', 'minibatch_kmeans', 'pointstore', 'congress_loader', 'vote_cache',
+           'vote_distance', 'hierarchy', 'cluster_metrics', 'kmeans_numpy', 'voting_blocks']
+
+IMPORT = '''
+import sys
+from time import perf_counter
+before = len(sys.modules)
+start = perf_counter()
+import {module}
+print(perf_counter() - start, len(sys.modules) - before)
+'''
+
+FIRST_CLUSTER = '''
+import sys
+from time import perf_counter
+before = len(sys.modules)
+start = perf_counter()
+from voting_blocks import analyze
+next(analyze({directory!r}, k={k}, seed=0, backend={backend!r}, n_init=1))
+print(perf_counter() - start, len(sys.modules) - before)
+'''
+
+
+def child(code: str) -> Optional[tuple]:
+    '(seconds inside the child, modules loaded, wall-clock seconds of the process), None if it failed'
+    here = os.path.dirname(os.path.abspath(__file__))
+    start = perf_counter()
+    done = subprocess.run([sys.executable, '-c', code], cwd=here, capture_output=True, text=True)
+    wall = perf_counter() - start
+    if done.returncode:
+        return None  # e.g. numpy is not installed
+    seconds, loaded = done.stdout.split()
+    return float(seconds), int(loaded), wall
+
+
+def measure(code: str, repeat: int) -> Optional[Dict[str, float]]:
+    'Fastest of repeat fresh-process runs (after one warm-up run that writes the .pyc files)'
+    runs = [child(code) for i in range(repeat + 1)][1:]
+    if None in runs:
+        return None
+    seconds, loaded, wall = min(runs)
+    return {'seconds': seconds, 'modules': loaded, 'wall_seconds': wall}
+
+
+def run(repeat: int, directory: str, k: int, backend: str, names: List[str]) -> dict:
+    from voting_blocks import load
+
+    load(directory)  # build the vote cache once, outside the timings
+    results = {'python -c pass': measure('print(0, 0)', repeat)}
+    for module in names:
+        results[f'import {module}'] = measure(IMPORT.format(module=module), repeat)
+    code = FIRST_CLUSTER.format(directory=os.path.abspath(directory), k=k, backend=backend)
+    results['first cluster'] = measure(code, repeat)
+    return {
+        'params': {'repeat': repeat, 'directory': directory, 'k': k, 'backend': backend},
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'stages': results,
+    }
+
+
+def report(result: dict, baseline: dict=None) -> None:
+    print(' '.join(f'{key}={value}' for key, value in result['params'].items()))
+    header = f'{"stage":<26} {"ms":>9} {"modules":>8} {"wall ms":>9}'
+    print(header + ('  speedup' if baseline else ''))
+    for name, stage in result['stages'].items():
+        if stage is None:
+            print(f'{name:<26} {"failed (missing dependency?)":>28}')
+            continue
+        line = f'{name:<26} {stage["seconds"] * 1000:>9.2f} {stage["modules"]:>8} {stage["wall_seconds"] * 1000:>9.1f}'
+        old = baseline and baseline['stages'].get(name)
+        if old and stage['seconds']:
+            line += f'  {old["seconds"] / stage["seconds"]:>6.2f}x'
+        print(line)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--votes', metavar='DIR', default='congress_data',
+                        help='congress_data directory for the first-cluster run (default: %(default)s)')
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--backend', default='python')
+    parser.add_argument('--modules', nargs='+', default=modules, help='modules to time the import of')
+    parser.add_argument('--save', metavar='FILE', help='write the results as JSON')
+    parser.add_argument('--compare', metavar='FILE', help='JSON results of an earlier run')
+    args = parser.parse_args(argv)
+
+    result = run(args.repeat, args.votes, args.k, args.backend, args.modules)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['params'] != result['params']:
+            print(f'warning: baseline params differ: {baseline["params"]}', file=sys.stderr)
+    report(result, baseline)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+'''Bootstrap confidence intervals with NumPy: every replicate drawn and reduced at once
+
+"02 analyzing data using simulations and resampling" estimates the
+uncertainty of a mean by resampling the data with replacement:
+
+    means = sorted(mean(bootstrap(timings)) for _ in range(n))    # bootstrap() is choices(data, k=len(data))
+
+which builds a Python list and calls ``statistics.mean`` per replicate.
+Here the resample indices are drawn as one integer matrix, shape
+(replicates, len(data)), the data is gathered through it in one step and
+the statistic reduces each row, so 10**6 replicates take well under a
+second for a small sample:
+
+    >>> confidence_interval(timings, 'mean', confidence=0.90, seed=0)
+    BootstrapInterval(estimate=8.377..., low=7.879..., high=9.143...)
+    >>> confidence_interval(timings, 'median', method='percentile', replicates=10**6, seed=0)
+
+Statistics are given by name, after the ``statistics`` module functions
+(mean, median, stdev, pstdev, variance, pvariance), or as any function
+that reduces an array along an ``axis`` argument, like ``np.mean`` or
+``np.percentile`` with a partial. Intervals are "percentile" (the
+notebook's method) or "bca", bias-corrected and accelerated, which also
+corrects for the median bias of the replicates and for a standard error
+that changes with the parameter (estimated with the jackknife).
+
+The indices use the smallest unsigned integer type that holds them, and
+the matrix is drawn in batches of about ``batch_elements`` entries to cap
+the memory. The same seed and batch size give the same replicates.
+
+NumPy is an optional dependency, as for kmeans_numpy.py.
+'''
+
+from typing import Callable, NamedTuple, Optional, Sequence, Union
+from functools import partial
+from statistics import NormalDist
+
+import numpy as np
+
+BootstrapInterval = NamedTuple('BootstrapInterval', [('estimate', float), ('low', float), ('high', float)])
+
+# name -> function(array, axis=...) for each statistic of the statistics module
+STATISTICS = {
+    'mean': np.mean,
+    'median': np.median,
+    'stdev': partial(np.std, ddof=1),
+    'pstdev': np.std,
+    'variance': partial(np.var, ddof=1),
+    'pvariance': np.var,
+}
+
+Statistic = Union[str, Callable[..., np.ndarray]]
+
+
+def rowwise(statistic: Statistic) -> Callable[[np.ndarray], np.ndarray]:
+    'The statistic of each row of a 2-d array'
+    if isinstance(statistic, str):
+        try:
+            statistic = STATISTICS[statistic]
+        except KeyError:
+            raise ValueError(f'Unknown statistic: {statistic!r}; use one of {sorted(STATISTICS)} '
+                             f'or a function with an axis argument') from None
+    return partial(statistic, axis=1)
+
+
+def resample_indices(n: int, replicates: int, rng: np.random.Generator) -> np.ndarray:
+    'Matrix of indices into n items, one row per replicate, in the smallest integer type that fits'
+    return rng.integers(0, n, size=(replicates, n), dtype=np.min_scalar_type(max(n - 1, 0)))
+
+
+def bootstrap(data: Sequence[float], statistic: Statistic='mean', replicates: int=10000,
+              seed=None, batch_elements: int=2 ** 22) -> np.ndarray:
+    '''The statistic of each of the bootstrap resamples of data (in draw order, not sorted)
+
+    seed is None, an int or a np.random.Generator.
+    '''
+    data = np.asarray(data, dtype=np.float64)
+    n = len(data)
+    if not n:
+        raise ValueError('bootstrap requires at least one data point')
+    reduce = rowwise(statistic)
+    rng = np.random.default_rng(seed)
+    batch = max(batch_elements // n, 1)
+    results = np.empty(replicates, dtype=np.float64)
+    for start in range(0, replicates, batch):
+        stop = min(start + batch, replicates)
+        results[start:stop] = reduce(data[resample_indices(n, stop - start, rng)])
+    return results
+
+
+def jackknife(data: Sequence[float], statistic: Statistic='mean', batch_elements: int=2 ** 22) -> np.ndarray:
+    'The statistic of data with each point left out in turn'
+    data = np.asarray(data, dtype=np.float64)
+    n = len(data)
+    if n < 2:
+        raise ValueError('jackknife requires at least two data points')
+    reduce = rowwise(statistic)
+    # Row i of the (n, n - 1) index matrix is every index but i
+    columns = np.arange(n - 1)
+    batch = max(batch_elements // n, 1)
+    results = np.empty(n, dtype=np.float64)
+    for start in range(0, n, batch):
+        rows = np.arange(start, min(start + batch, n))
+        indices = columns + (columns >= rows[:, None])
+        results[start:start + len(rows)] = reduce(data[indices])
+    return results
+
+
+def percentile_interval(replicates: np.ndarray, confidence: float=0.95) -> tuple:
+    'Central interval holding the given share of the replicates'
+    tail = (1 - confidence) / 2
+    low, high = np.quantile(replicates, [tail, 1 - tail])
+    return float(low), float(high)
+
+
+def bca_interval(data: Sequence[float], replicates: np.ndarray, statistic: Statistic='mean',
+                 confidence: float=0.95, estimate: Optional[float]=None) -> tuple:
+    '''Bias-corrected and accelerated interval (Efron, 1987)
+
+    The percentile interval with its two quantiles moved: by the bias
+    z0, from the share of replicates below the estimate, and by the
+    acceleration a, from the skewness of the jackknife statistics.
+    '''
+    if estimate is None:
+        estimate = float(rowwise(statistic)(np.asarray(data, dtype=np.float64)[None, :])[0])
+    normal = NormalDist()
+    below = (np.count_nonzero(replicates < estimate) + np.count_nonzero(replicates == estimate) / 2)
+    share = below / len(replicates)
+    if not 0 < share < 1:
+        raise ValueError('BCa interval undefined: every replicate is on one side of the estimate')
+    z0 = normal.inv_cdf(share)
+    leave_one_out = jackknife(data, statistic)
+    deviations = leave_one_out.mean() - leave_one_out
+    squares = float((deviations ** 2).sum())
+    acceleration = float((deviations ** 3).sum()) / (6 * squares ** 1.5) if squares else 0.0
+    tail = (1 - confidence) / 2
+    quantiles = []
+    for z in (normal.inv_cdf(tail), normal.inv_cdf(1 - tail)):
+        shifted = z0 + z
+        quantiles.append(normal.cdf(z0 + shifted / (1 - acceleration * shifted)))
+    low, high = np.quantile(replicates, quantiles)
+    return float(low), float(high)
+
+
+def confidence_interval(data: Sequence[float], statistic: Statistic='mean', confidence: float=0.95,
+                        method: str='bca', replicates: int=10000, seed=None) -> BootstrapInterval:
+    'Statistic of data with its bootstrap confidence interval; method is "bca" or "percentile"'
+    data = np.asarray(data, dtype=np.float64)
+    estimate = float(rowwise(statistic)(data[None, :])[0])
+    resampled = bootstrap(data, statistic, replicates, seed)
+    if method == 'percentile':
+        low, high = percentile_interval(resampled, confidence)
+    elif method == 'bca':
+        low, high = bca_interval(data, resampled, statistic, confidence, estimate)
+    else:
+        raise ValueError(f'Unknown interval method: {method!r}')
+    return BootstrapInterval(estimate, low, high)
+
+
+if __name__ == "__main__":
+    from random import Random
+    from statistics import mean
+    from time import perf_counter
+
+    timings = [7.18, 8.59, 12.24, 7.39, 8.16, 8.68, 6.98, 8.31, 9.06, 7.06, 7.67, 10.02, 6.87, 9.07]
+
+    # The notebook's way, for reference
+    rng = Random(0)
+    start = perf_counter()
+    means = sorted(mean(rng.choices(timings, k=len(timings))) for _ in range(10000))
+    print(f'notebook, 10**4 replicates: {perf_counter() - start:.3f}s  90% CI {means[500]:.2f} to {means[-500]:.2f}')
+
+    for statistic in ['mean', 'median', 'stdev']:
+        for method in ['percentile', 'bca']:
+            start = perf_counter()
+            interval = confidence_interval(timings, statistic, 0.90, method, replicates=10 ** 6, seed=0)
+            print(f'{statistic:<6} {method:<10} 10**6 replicates: {perf_counter() - start:.3f}s  '
+                  f'{interval.estimate:.2f}, 90% CI {interval.low:.2f} to {interval.high:.2f}')
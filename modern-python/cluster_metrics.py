@@ -0,0 +1,122 @@
+'''Cluster-quality metrics and a k sweep to choose the number of clusters
+
+For every candidate k the sweep runs k-means and scores the labels with
+
+- inertia:    sum of squared distances to the assigned centroid (lower is tighter)
+- silhouette: mean over points of (b - a) / max(a, b), where a is the mean distance
+              to the point's own cluster and b to the nearest other one (-1 .. 1)
+- purity:     fraction of points whose cluster's majority class (e.g. party) is theirs
+
+The pairwise distance matrix that the silhouette needs is computed once
+and shared by every k; the ks run in a process pool that receives the
+points and the matrix once per worker.
+
+    >>> for row in sweep(record.values(), range(2, 8), classes=[s.party for s in record]):
+    ...     print(row)
+'''
+
+from typing import Dict, Hashable, List, NamedTuple, Optional, Sequence
+from collections import Counter
+from math import fsum
+
+from kmeans import Point, dist, k_means_fit
+
+KScore = NamedTuple('KScore', [('k', int), ('inertia', float), ('silhouette', float),
+                               ('purity', Optional[float]), ('iterations', int)])
+
+
+def pairwise_distances(points: Sequence[Point], metric=dist) -> List[List[float]]:
+    'Full symmetric matrix of metric distances between all points'
+    n = len(points)
+    matrix = [[0.0] * n for i in range(n)]
+    for i in range(n):
+        p, row = points[i], matrix[i]
+        for j in range(i + 1, n):
+            row[j] = matrix[j][i] = metric(p, points[j])
+    return matrix
+
+
+def silhouette(distances: Sequence[Sequence[float]], labels: Sequence[int]) -> float:
+    'Mean silhouette coefficient; points alone in their cluster score 0'
+    k = max(labels) + 1
+    sizes = Counter(labels)
+    if len(sizes) < 2:
+        return 0.0
+    scores = []
+    for i, row in enumerate(distances):
+        # Sum of distances from point i to each cluster, in one pass over the row
+        totals = [0.0] * k
+        for d, label in zip(row, labels):
+            totals[label] += d
+        own = labels[i]
+        if sizes[own] == 1:
+            scores.append(0.0)
+            continue
+        a = totals[own] / (sizes[own] - 1)
+        b = min(totals[c] / sizes[c] for c in sizes if c != own)
+        scores.append((b - a) / max(a, b) if max(a, b) > 0 else 0.0)
+    return fsum(scores) / len(scores)
+
+
+def purity(labels: Sequence[int], classes: Sequence[Hashable]) -> float:
+    'Fraction of points that belong to the majority class of their cluster'
+    per_cluster = {}  # type: Dict[int, Counter]
+    for label, cls in zip(labels, classes):
+        per_cluster.setdefault(label, Counter())[cls] += 1
+    return sum(counts.most_common(1)[0][1] for counts in per_cluster.values()) / len(labels)
+
+
+def score(points: Sequence[Point], distances: Sequence[Sequence[float]], k: int,
+          classes: Optional[Sequence[Hashable]]=None, **kwargs) -> KScore:
+    'Run k-means for one k and score the result'
+    result = k_means_fit(points, k, **kwargs)
+    labels = list(result.labels)
+    return KScore(k, result.inertia[-1], silhouette(distances, labels),
+                  purity(labels, classes) if classes is not None else None, result.iterations)
+
+
+_shared = None  # type: Optional[tuple]
+
+
+def _init_worker(points, distances, classes, kwargs):
+    global _shared
+    _shared = points, distances, classes, kwargs
+
+
+def _score_k(k: int) -> KScore:
+    points, distances, classes, kwargs = _shared
+    return score(points, distances, k, classes, **kwargs)
+
+
+def sweep(points: Sequence[Point], ks: Sequence[int], classes: Optional[Sequence[Hashable]]=None,
+          workers: Optional[int]=None, metric=dist, init: str='k-means++', seed: int=0,
+          **kwargs) -> List[KScore]:
+    '''Score k-means for every k in ks; workers=1 runs in this process
+
+    Extra keyword arguments (n_init, iterations, tol, ...) go to k_means_fit.
+    The seed is fixed so every k, in any worker, gets a reproducible run.
+    '''
+    points = list(points)
+    classes = list(classes) if classes is not None else None
+    distances = pairwise_distances(points, metric)
+    # Parallelism is across ks: each k's restarts (n_init) run serially inside its worker
+    kwargs = dict(kwargs, init=init, seed=seed, workers=1)
+    if metric is not dist:
+        kwargs['metric'] = metric
+    if workers == 1:
+        return [score(points, distances, k, classes, **kwargs) for k in ks]
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(points, distances, classes, kwargs)) as executor:
+        return list(executor.map(_score_k, ks))
+
+
+if __name__ == "__main__":
+    from vote_cache import load_matrix
+
+    record = load_matrix().record()
+    parties = [senator.party for senator in record]
+    print(f'{"k":>3} {"inertia":>10} {"silhouette":>11} {"purity":>7} {"iterations":>11}')
+    for row in sweep(record.values(), range(2, 9), classes=parties, n_init=5):
+        print(f'{row.k:>3} {row.inertia:>10.1f} {row.silhouette:>11.3f} {row.purity:>7.2f} {row.iterations:>11}')
@@ -0,0 +1,114 @@
+'''Load the congress_data roll-call CSV files into a senator -> vote history record
+
+Each file is one roll-call vote:
+
+    Senate Vote #116 2016-06-29T19:03:00 - S. 2328: National Sea Grant ...
+    person,state,district,vote,name,party
+    300002,TN,,Yea,Sen. Lamar Alexander [R],Republican
+    ...
+
+Files are parsed in a process pool and merged in vote-number order, so the
+record is the same whatever the number of workers. The topic line of each
+file is kept as metadata.
+'''
+
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+import csv
+import glob
+import os
+import re
+
+Senator = NamedTuple('Senator', [('name', str), ('party', str), ('state', str)])
+VoteValue = int
+VoteHistory = Tuple[VoteValue, ...]
+
+vote_value = {'Yea': 1, 'Nay': -1, 'Not Voting': 0}  # type: Dict[str, VoteValue]
+
+# Marks a vote taken while the senator was not in office (turnover), as opposed
+# to 'Not Voting'. Fits in an int8 so the binary cache can store it.
+ABSENT = -128  # type: VoteValue
+
+VoteInfo = NamedTuple('VoteInfo', [('vote_id', str), ('session', str), ('number', int), ('topic', str)])
+VoteFile = NamedTuple('VoteFile', [('info', VoteInfo), ('votes', List[Tuple[Senator, VoteValue]])])
+
+_filename_pattern = re.compile(r'_(?P<session>\d+-\d+)_(?P<vote_id>[a-z]+(?P<number>\d+))\.csv$')
+
+
+def vote_info(filename: str, topic: str='') -> VoteInfo:
+    'Vote id ("s152"), session ("114-2016") and number (152) from a congress_data filename'
+    match = _filename_pattern.search(os.path.basename(filename))
+    if match is None:
+        raise ValueError(f'Not a congress_votes_<session>_<vote id>.csv filename: {filename!r}')
+    return VoteInfo(match['vote_id'], match['session'], int(match['number']), topic)
+
+
+def sort_key(info: VoteInfo) -> Tuple[str, str, int]:
+    'Order votes by session, chamber, then vote number (s20 before s116)'
+    return info.session, info.vote_id.rstrip('0123456789'), info.number
+
+
+def parse_vote_file(filename: str) -> VoteFile:
+    'Read one roll-call CSV file'
+    with open(filename, encoding='utf-8') as f:
+        reader = csv.reader(f)
+        topic = next(reader)
+        headers = next(reader)
+        votes = [(Senator(name, party, state), vote_value[vote])
+                 for person, state, district, vote, name, party in reader]
+    return VoteFile(vote_info(filename, ','.join(topic)), votes)
+
+
+def vote_filenames(directory: str='congress_data') -> List[str]:
+    return glob.glob(os.path.join(directory, '*.csv'))
+
+
+def parse_vote_files(filenames: Sequence[str], workers: Optional[int]=None) -> List[VoteFile]:
+    'Parse the files concurrently (workers=1 parses in this process), ordered by vote number'
+    filenames = sorted(filenames, key=lambda filename: sort_key(vote_info(filename)))
+    if workers == 1 or len(filenames) <= 1:
+        return list(map(parse_vote_file, filenames))
+    # Several files per task keeps the pickling overhead low for thousands of small files
+    chunksize = max(1, len(filenames) // (4 * (workers or os.cpu_count() or 1)))
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(workers) as executor:
+        return list(executor.map(parse_vote_file, filenames, chunksize=chunksize))
+
+
+def build_record(vote_files: Sequence[VoteFile]) -> Dict[Senator, VoteHistory]:
+    '''Merge parsed files, in order, into senator -> tuple of votes
+
+    Vote i of every history is always the i-th file: a senator who was not
+    in office for a vote gets ABSENT there, so histories never get shorter
+    or shift against each other when senators come and go.
+    '''
+    accumulated_record = {}  # type: Dict[Senator, List[VoteValue]]
+    for column, vote_file in enumerate(vote_files):
+        for senator, vote in vote_file.votes:
+            if senator not in accumulated_record:
+                accumulated_record[senator] = [ABSENT] * len(vote_files)
+            accumulated_record[senator][column] = vote
+    return {senator: tuple(votes) for senator, votes in accumulated_record.items()}
+
+
+def has_absences(histories: Iterable[VoteHistory]) -> bool:
+    'True if some senator was not in office for some vote'
+    return any(ABSENT in votes for votes in histories)
+
+
+def load_record(directory: str='congress_data',
+                workers: Optional[int]=None) -> Tuple[Dict[Senator, VoteHistory], List[VoteInfo]]:
+    'Vote record of every senator, plus the metadata of each vote in column order'
+    vote_files = parse_vote_files(vote_filenames(directory), workers)
+    return build_record(vote_files), [vote_file.info for vote_file in vote_files]
+
+
+if __name__ == "__main__":
+    from time import perf_counter
+
+    for workers in [1, None]:
+        start = perf_counter()
+        record, votes = load_record(workers=workers)
+        print(f'workers={workers}: {len(record)} senators x {len(votes)} votes '
+              f'in {perf_counter() - start:.3f}s')
+    print(votes[0])
@@ -0,0 +1,189 @@
+'''Agglomerative (hierarchical) clustering of senators
+
+k-means needs k up front. Agglomerative clustering instead builds the
+whole merge tree (dendrogram) once; cutting it into any number of
+clusters afterwards is a replay of the first n - k merges.
+
+The tree is built with the nearest-neighbour chain algorithm (Murtagh
+1983, see Müllner, "Modern hierarchical, agglomerative clustering
+algorithms", 2011): follow nearest neighbours until two clusters are each
+other's nearest neighbour, merge them, and update distances with the
+Lance-Williams formula. That is O(n^2) time and memory instead of the
+O(n^3) of re-scanning every pair after every merge. It is exact for the
+"reducible" linkages below: single, complete, average, weighted, ward.
+
+    >>> tree = Dendrogram.from_points(record.values(), labels=list(record), method='average')
+    >>> for k in range(2, 6):
+    ...     print(k, [len(cluster) for cluster in tree.clusters(k)])
+'''
+
+from typing import Callable, Dict, Hashable, List, NamedTuple, Optional, Sequence
+
+from kmeans import Point, dist
+
+Merge = NamedTuple('Merge', [('left', int), ('right', int), ('height', float), ('size', int)])
+
+
+def _single(d_ik, d_jk, d_ij, n_i, n_j, n_k):
+    return min(d_ik, d_jk)
+
+
+def _complete(d_ik, d_jk, d_ij, n_i, n_j, n_k):
+    return max(d_ik, d_jk)
+
+
+def _average(d_ik, d_jk, d_ij, n_i, n_j, n_k):
+    return (n_i * d_ik + n_j * d_jk) / (n_i + n_j)
+
+
+def _weighted(d_ik, d_jk, d_ij, n_i, n_j, n_k):
+    return (d_ik + d_jk) / 2
+
+
+def _ward(d_ik, d_jk, d_ij, n_i, n_j, n_k):
+    # On squared distances
+    return ((n_i + n_k) * d_ik + (n_j + n_k) * d_jk - n_k * d_ij) / (n_i + n_j + n_k)
+
+
+linkages = {
+    'single': _single,
+    'complete': _complete,
+    'average': _average,
+    'weighted': _weighted,
+    'ward': _ward,
+}  # type: Dict[str, Callable[..., float]]
+
+
+def nn_chain(distances: Sequence[Sequence[float]], method: str='average') -> List[Merge]:
+    '''Merges of the agglomerative clustering of a full, symmetric distance matrix
+
+    Returned like scipy's linkage matrix: sorted by height, observation i
+    is cluster i and the cluster created by merge m is cluster n + m.
+    '''
+    try:
+        update = linkages[method]
+    except KeyError:
+        raise ValueError(f'Unknown linkage method: {method!r}') from None
+    n = len(distances)
+    squared = method == 'ward'
+    D = [[d * d if squared else d for d in row] for row in distances]
+    size = [1] * n
+    active = set(range(n))
+    chain = []  # type: List[int]
+    pairs = []  # (height, i, j): clusters are kept in the row of one of their members
+
+    while len(active) > 1:
+        if not chain:
+            chain.append(min(active))
+        while True:
+            a = chain[-1]
+            previous = chain[-2] if len(chain) > 1 else None
+            row = D[a]
+            # Prefer the previous element on ties, otherwise the chain could cycle
+            b = previous if previous is not None else -1
+            best = row[b] if previous is not None else float('inf')
+            for x in active:
+                if x != a and row[x] < best:
+                    b, best = x, row[x]
+            if b == previous:
+                break
+            chain.append(b)
+        a, b = chain.pop(), chain.pop()
+        i, j = min(a, b), max(a, b)
+        d_ij = D[i][j]
+        pairs.append((d_ij, i, j))
+        active.discard(j)
+        n_i, n_j = size[i], size[j]
+        for k in active:
+            if k != i:
+                D[i][k] = D[k][i] = update(D[i][k], D[j][k], d_ij, n_i, n_j, size[k])
+        size[i] = n_i + n_j
+
+    # Sort by height and give each merged cluster its scipy-style id
+    parent = list(range(n))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    cluster_id = list(range(n))
+    cluster_size = [1] * n
+    merges = []
+    for height, i, j in sorted(pairs):
+        ri, rj = find(i), find(j)
+        left, right = sorted((cluster_id[ri], cluster_id[rj]))
+        total = cluster_size[ri] + cluster_size[rj]
+        parent[rj] = ri
+        cluster_id[ri] = n + len(merges)
+        cluster_size[ri] = total
+        merges.append(Merge(left, right, height ** 0.5 if squared else height, total))
+    return merges
+
+
+class Dendrogram:
+    'The full merge tree of n labelled observations; cut it into any number of clusters'
+
+    def __init__(self, labels: Sequence[Hashable], merges: Sequence[Merge]):
+        self.labels = list(labels)
+        self.merges = list(merges)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(<{len(self.labels)} observations>)'
+
+    @classmethod
+    def from_distances(cls, distances: Sequence[Sequence[float]], labels: Optional[Sequence[Hashable]]=None,
+                       method: str='average') -> 'Dendrogram':
+        labels = list(range(len(distances))) if labels is None else labels
+        return cls(labels, nn_chain(distances, method))
+
+    @classmethod
+    def from_points(cls, points: Sequence[Point], labels: Optional[Sequence[Hashable]]=None,
+                    method: str='average', metric=dist) -> 'Dendrogram':
+        'Build the tree from the pairwise metric distances of the points'
+        points = list(points)
+        n = len(points)
+        distances = [[0.0] * n for i in range(n)]
+        for i in range(n):
+            for j in range(i + 1, n):
+                distances[i][j] = distances[j][i] = metric(points[i], points[j])
+        return cls.from_distances(distances, labels, method)
+
+    def cut(self, k: int) -> List[int]:
+        'Cluster number (0 .. k-1, in order of first appearance) of every observation'
+        n = len(self.labels)
+        if not 1 <= k <= n:
+            raise ValueError(f'k must be between 1 and {n}, got {k}')
+        parent = list(range(2 * n - 1))
+        for m, merge in enumerate(self.merges[:n - k]):
+            parent[merge.left] = parent[merge.right] = n + m
+
+        def root(x):
+            while parent[x] != x:
+                x = parent[x]
+            return x
+
+        numbers = {}  # type: Dict[int, int]
+        return [numbers.setdefault(root(i), len(numbers)) for i in range(n)]
+
+    def clusters(self, k: int) -> List[List[Hashable]]:
+        'The labels of each of the k clusters'
+        groups = [[] for i in range(k)]  # type: List[List[Hashable]]
+        for label, number in zip(self.labels, self.cut(k)):
+            groups[number].append(label)
+        return groups
+
+
+if __name__ == "__main__":
+    from collections import Counter
+
+    from vote_cache import load_matrix
+    from vote_distance import disagreement_matrix, pack_record
+
+    record = load_matrix().record()
+    senators, packed = pack_record(record)
+    tree = Dendrogram.from_distances(disagreement_matrix(packed), senators, method='average')
+    for k in range(2, 5):
+        print(f'k={k}:', [dict(Counter(senator.party for senator in cluster))
+                          for cluster in tree.clusters(k)])
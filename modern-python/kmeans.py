@@ -13,22 +13,38 @@
 #     name: python3
 # ---
 
-from pprint import pprint
-from typing import *
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Sized, Tuple
 
 from functools import partial
 from collections import defaultdict
 from math import fsum, sqrt
-from random import sample
+from itertools import count
+from operator import itemgetter, mul
+from random import Random
+import random
 
 Point = Tuple[int, ...]
 Centroid = Point
 
+KMeansResult = NamedTuple('KMeansResult', [('centroids', List[Centroid]),
+                                           ('labels', List[int]),
+                                           ('inertia', List[float]),
+                                           ('iterations', int),
+                                           ('converged', bool)])
+
 
 def mean(data: Iterable[float]) -> float:
-    'Accurate arithmetic mean'
-    data = list(data)
-    return fsum(data) / len(data)
+    'Accurate arithmetic mean, in one pass over any iterable: no list is built from an iterator'
+    if isinstance(data, Sized):
+        n = len(data)
+        total = fsum(data)
+    else:
+        counter = count()
+        total = fsum(map(itemgetter(0), zip(data, counter)))  # zip pulls from counter once per value
+        n = next(counter)
+    if not n:
+        raise ValueError('mean requires at least one data point')
+    return total / n
 
 
 # fsum, sqrt, zip as arguments so that can be loaded locally in the function -> faster than load globally. 
@@ -40,34 +56,288 @@ def dist(p: Point, q: Point, fsum=fsum, sqrt=sqrt, zip=zip) -> float:
     return sqrt(fsum([(x - y) ** 2 for x, y in zip(p, q)]))
 
 
-def assign_data(centroids: Sequence[Point], data: Iterable[Point]) -> Dict[Centroid, List[Point]]:
+def manhattan(p: Point, q: Point, fsum=fsum, zip=zip) -> float:
+    'Sum of absolute coordinate differences (city-block distance)'
+    return fsum([abs(x - y) for x, y in zip(p, q)])
+
+
+def hamming(p: Point, q: Point, zip=zip) -> int:
+    'Number of coordinates that differ'
+    return sum(x != y for x, y in zip(p, q))
+
+
+def assign_data(centroids: Sequence[Point], data: Iterable[Point], metric=dist) -> Dict[Centroid, List[Point]]:
     'Group the data points to the closest centroid'
     d = defaultdict(list)
     for point in data:
-        closest_centroid = min(centroids, key=partial(dist, point))
+        closest_centroid = min(centroids, key=partial(metric, point))
         d[closest_centroid].append(point)
     return dict(d)
 
 
+def nearest(centroids: Sequence[Point], data: Iterable[Point],
+            weights: Optional[Sequence[float]]=None, metric=dist) -> Tuple[List[int], float]:
+    'Index of the closest centroid for each point, plus the (weighted) inertia: sum of squared distances'
+    labels = []
+    squared = []
+    indices = range(len(centroids))
+    for point in data:
+        distances = [metric(point, centroid) for centroid in centroids]
+        label = min(indices, key=distances.__getitem__)
+        labels.append(label)
+        squared.append(distances[label] ** 2)
+    if weights is not None:
+        squared = [w * d2 for w, d2 in zip(weights, squared)]
+    return labels, fsum(squared)
+
+
+def assign_labels(centroids: Sequence[Point], data: Iterable[Point], metric=dist) -> List[int]:
+    'Index of the closest centroid for each point'
+    return nearest(centroids, data, metric=metric)[0]
+
+
 def transpose(data):
     return list(zip(*data))
 
 
+def group_centroid(group: Sequence[Point]) -> Centroid:
+    'Accurate mean of a group, one fsum per column'
+    n = len(group)
+    return tuple([fsum(column) / n for column in zip(*group)])
+
+
+def weighted_centroid(group: Sequence[Point], weights: Sequence[float]) -> Centroid:
+    'Accurate weighted mean of a group, e.g. of unique points weighted by how often they occur'
+    total = fsum(weights)
+    return tuple([fsum(map(mul, column, weights)) / total for column in zip(*group)])
+
+
 def compute_centroids(groups: Iterable[Sequence[Point]]) -> List[Centroid]:
     'Compute the centroid of each group'
-    return [tuple(map(mean, transpose(group))) for group in groups]
+    return list(map(group_centroid, groups))
+
+
+def gather(indices: Sequence[int]):
+    'Function from a sequence to the tuple of its items at indices'
+    if len(indices) == 1:
+        index, = indices
+        return lambda sequence: (sequence[index],)  # itemgetter(i) returns the bare item
+    return itemgetter(*indices)
+
+
+def column_centroids(centroids: Sequence[Centroid], columns: Sequence[Sequence[float]], labels: Sequence[int],
+                     weights: Optional[Sequence[float]]=None) -> List[Centroid]:
+    'update_centroids from the data by column: each coordinate is an fsum of a column at the cluster\'s indices'
+    members = [[] for old in centroids]  # type: List[List[int]]
+    for index, label in enumerate(labels):
+        members[label].append(index)
+    new_centroids = []
+    for old, indices in zip(centroids, members):
+        if not indices:
+            new_centroids.append(tuple(old))
+            continue
+        get = gather(indices)
+        if weights is None:
+            n = len(indices)
+            new_centroids.append(tuple([fsum(get(column)) / n for column in columns]))
+        else:
+            group_weights = get(weights)
+            total = fsum(group_weights)
+            new_centroids.append(tuple([fsum(map(mul, get(column), group_weights)) / total
+                                        for column in columns]))
+    return new_centroids
+
+
+def update_centroids(centroids: Sequence[Centroid], data: Sequence[Point], labels: Sequence[int],
+                     weights: Optional[Sequence[float]]=None) -> List[Centroid]:
+    '''Recompute each centroid from its labeled points; an empty group keeps its old centroid
+
+    The points are grouped and each column is one C fsum. Sums kept per
+    cluster and updated as each point is assigned cost a Python-level step
+    per point: 2.7x slower exact (ints), 9x with two-sum compensation
+    (floats), on 5000 x 10 points.
+
+    Data with a columns() method (a PointStore) is read by column instead,
+    with no groups of rows and no transposes: see column_centroids.
+    '''
+    if hasattr(data, 'columns'):
+        return column_centroids(centroids, data.columns(), labels, weights)
+    groups = [[] for old in centroids]  # type: List[List[Point]]
+    for point, label in zip(data, labels):
+        groups[label].append(point)
+    if weights is None:
+        return [group_centroid(group) if group else tuple(old) for old, group in zip(centroids, groups)]
+    group_weights = [[] for old in centroids]  # type: List[List[float]]
+    for w, label in zip(weights, labels):
+        group_weights[label].append(w)
+    return [weighted_centroid(group, w) if group else tuple(old)
+            for old, group, w in zip(centroids, groups, group_weights)]
+
+
+def deduplicate(data: Iterable[Point]) -> Tuple[List[Point], List[int], List[int]]:
+    '''Collapse identical points: (unique points in first-seen order, how often
+    each occurs, index into the unique points of every original point)
+
+    Clustering the unique points with weights=counts gives the same
+    centroids as clustering all of them; labels map back through the index:
+    label of data[i] == result.labels[inverse[i]].
+    '''
+    index = {}  # type: Dict[Point, int]
+    unique = []  # type: List[Point]
+    counts = []  # type: List[int]
+    inverse = []  # type: List[int]
+    for point in data:
+        key = tuple(point)
+        i = index.get(key)
+        if i is None:
+            i = index[key] = len(unique)
+            unique.append(point)
+            counts.append(0)
+        counts[i] += 1
+        inverse.append(i)
+    return unique, counts, inverse
 
 
-def k_means(data: Iterable[Point], k: int=2, iterations: int=50) -> List[Centroid]:
-    data = list(data)
-    centroids = sample(data, k)
-    for i in range(iterations):
-        labeled = assign_data(centroids, data)
-        centroids = compute_centroids(labeled.values())
-    return centroids
+def k_means_plus_plus(data: Sequence[Point], k: int, rng=random,
+                      weights: Optional[Sequence[float]]=None) -> List[Centroid]:
+    'Pick k seeds: each new one is drawn with probability proportional to its squared distance to the closest seed'
+    centroids = [rng.choice(data) if weights is None else rng.choices(data, weights)[0]]
+    closest = [dist(point, centroids[0]) ** 2 for point in data]
+    while len(centroids) < k:
+        if fsum(closest) > 0:
+            odds = closest if weights is None else [w * d2 for w, d2 in zip(weights, closest)]
+            centroid = rng.choices(data, weights=odds)[0]
+        else:
+            centroid = rng.choice(data)  # fewer distinct points than k
+        centroids.append(centroid)
+        closest = [min(d, dist(point, centroid) ** 2) for d, point in zip(closest, data)]
+    return [tuple(centroid) for centroid in centroids]
 
 
+def initial_centroids(data: Sequence[Point], k: int, init='k-means++', rng=random,
+                      weights: Optional[Sequence[float]]=None) -> List[Centroid]:
+    'Seed centroids with "random" (a sample of the data), "k-means++", or an explicit list of centroids'
+    if init == 'random':
+        return [tuple(point) for point in rng.sample(data, k)]
+    if init == 'k-means++':
+        return k_means_plus_plus(data, k, rng, weights)
+    if isinstance(init, str):
+        raise ValueError(f'Unknown init method: {init!r}')
+    return [tuple(centroid) for centroid in init]
+
+
+def k_means_fit(data: Iterable[Point], k: int=2, iterations: int=50, tol: float=0.0,
+                init='random', seed: Optional[int]=None, n_init: int=1,
+                workers: Optional[int]=None, assign=nearest,
+                weights: Optional[Sequence[float]]=None, metric=dist) -> KMeansResult:
+    '''Run k-means until the labels stop changing, the largest centroid shift
+    is <= tol, or the iteration budget is spent
+
+    The returned labels and last inertia are always those of the returned
+    centroids, however the loop stopped.
+
+    assign(centroids, data[, weights]) -> (labels, inertia) is the assignment
+    step; kmeans_elkan.ElkanAssigner is a faster stateful drop-in for nearest().
+
+    weights (e.g. the counts from deduplicate()) count each point that many
+    times in the centroids, the inertia and the k-means++ draws.
+
+    metric(point, centroid) replaces dist in the assignment step (e.g.
+    manhattan, or vote_distance.disagreement); centroids are still means.
+
+    With n_init > 1 the restarts run in a process pool and the solution
+    with the lowest final inertia wins; see best_of_restarts().
+    '''
+    if not isinstance(data, Sequence):
+        data = list(data)  # any sized, indexable collection (e.g. a PointStore) is used as is
+    if n_init > 1:
+        return best_of_restarts(k_means_fit, data, n_init, workers, seed,
+                                k=k, iterations=iterations, tol=tol, init=init, assign=assign,
+                                weights=weights, metric=metric)
+    rng = random if seed is None else Random(seed)
+    centroids = initial_centroids(data, k, init, rng, weights)
+    if weights is not None:
+        assign = partial(assign, weights=weights)
+    if metric is not dist:
+        assign = partial(assign, metric=metric)
+    previous = None
+    labels = []  # type: List[int]
+    inertia = []
+    converged = False
+    iteration = 0
+    for iteration in range(1, iterations + 1):
+        labels, total = assign(centroids, data)
+        inertia.append(total)
+        if labels == previous:
+            converged = True
+            break
+        new_centroids = update_centroids(centroids, data, labels, weights)
+        shift = max(map(dist, centroids, new_centroids))
+        centroids, previous = new_centroids, labels
+        if shift <= tol:
+            converged = True
+            labels, total = assign(centroids, data)
+            inertia.append(total)
+            break
+    else:
+        # Budget spent: the centroids moved after the last labelling, label the data with them
+        labels, total = assign(centroids, data)
+        inertia.append(total)
+    return KMeansResult(centroids, labels, inertia, iteration, converged)
+
+
+def restart_seeds(n_init: int, seed: Optional[int]=None) -> List[int]:
+    'Independent, reproducible seeds for each restart, derived only from the base seed'
+    rng = random if seed is None else Random(seed)
+    return [rng.getrandbits(64) for i in range(n_init)]
+
+
+_worker_data = None  # type: Optional[List[Point]]
+
+
+def _init_worker(data):
+    global _worker_data
+    _worker_data = data
+
+
+def _run_restart(fit, kwargs, seed):
+    return fit(_worker_data, seed=seed, **kwargs)
+
+
+def final_inertia(result: KMeansResult) -> float:
+    'Inertia of the centroids a fit returned'
+    return result.inertia[-1]
+
+
+def best_of_restarts(fit, data: Sequence[Point], n_init: int=10, workers: Optional[int]=None,
+                     seed: Optional[int]=None, **kwargs) -> KMeansResult:
+    '''Run fit(data, seed=..., **kwargs) once per restart seed and keep the lowest final inertia
+
+    The data is sent to each worker process once, not once per restart.
+    Each restart's seed is fixed up front, so the winner does not depend
+    on the number of workers or the order in which restarts finish.
+    Restarts are scored with final_inertia: fit must label the data with
+    the centroids it returns, as every k_means_fit here does, even when
+    it stops on the iteration budget.
+    '''
+    seeds = restart_seeds(n_init, seed)
+    if workers == 1:
+        results = [fit(data, seed=s, **kwargs) for s in seeds]
+    else:
+        # Imported here: concurrent.futures.process is most of the cost of importing this module
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(data,)) as executor:
+            results = list(executor.map(partial(_run_restart, fit, kwargs), seeds))
+    return min(results, key=final_inertia)
+
+
+def k_means(data: Iterable[Point], k: int=2, iterations: int=50, tol: float=0.0, **kwargs) -> List[Centroid]:
+    return k_means_fit(data, k, iterations, tol, **kwargs).centroids
+
 if __name__ == "__main__":
+    from pprint import pprint
+
     points = [
         (10, 41, 23),
         (22, 30, 29),
@@ -0,0 +1,133 @@
+'''Triangle-inequality accelerated assignment for kmeans.k_means_fit (Elkan, 2003)
+
+Most points keep their closest centroid from one iteration to the next.
+For each point we keep an upper bound on the distance to its assigned
+centroid and a lower bound on the distance to every other centroid.
+When the centroids move by s_j, the bounds move by at most s_j, so they
+can be updated without touching the data.  A point is skipped when
+
+- its upper bound is below half the distance from its centroid to the
+  nearest other centroid, or
+- its upper bound is below the lower bound for a candidate centroid, or
+  below half the distance between the two centroids.
+
+Only the remaining point/centroid pairs call ``dist``.
+
+    >>> engine = ElkanAssigner()
+    >>> result = k_means_fit(data, k=20, assign=engine)
+    >>> engine.skipped, engine.evaluations
+'''
+
+from typing import List, Optional, Sequence, Tuple
+from math import fsum
+
+from kmeans import Point, Centroid, dist
+
+
+class ElkanAssigner:
+    '''Drop-in replacement for kmeans.nearest that remembers bounds between calls
+
+    Counts every point/centroid distance it evaluates (``evaluations``) and
+    every one it proved unnecessary (``skipped``).
+    '''
+
+    def __init__(self):
+        self.data = None  # type: Optional[Sequence[Point]]
+        self.centroids = []  # type: List[Centroid]
+        self.labels = []  # type: List[int]
+        self.upper = []  # type: List[float]
+        self.lower = []  # type: List[List[float]]
+        self.evaluations = 0
+        self.skipped = 0
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(evaluations={self.evaluations}, skipped={self.skipped})'
+
+    def __call__(self, centroids: Sequence[Centroid], data: Sequence[Point],
+                 weights: Optional[Sequence[float]]=None) -> Tuple[List[int], float]:
+        'Index of the closest centroid for each point, plus the (weighted) inertia'
+        centroids = list(centroids)
+        if data is not self.data or len(centroids) != len(self.centroids):
+            self._reset(centroids, data)
+        else:
+            self._update(centroids, data)
+        self.centroids = centroids
+        if weights is None:
+            return list(self.labels), fsum(u * u for u in self.upper)
+        return list(self.labels), fsum(w * u * u for w, u in zip(weights, self.upper))
+
+    def _reset(self, centroids: List[Centroid], data: Sequence[Point]) -> None:
+        'First call for this data: compute every distance once'
+        self.data = data
+        self.labels = []
+        self.upper = []
+        self.lower = []
+        indices = range(len(centroids))
+        for point in data:
+            distances = [dist(point, centroid) for centroid in centroids]
+            label = min(indices, key=distances.__getitem__)
+            self.labels.append(label)
+            self.upper.append(distances[label])
+            self.lower.append(distances)
+        self.evaluations += len(data) * len(centroids)
+
+    def _update(self, centroids: List[Centroid], data: Sequence[Point]) -> None:
+        k = len(centroids)
+        shifts = list(map(dist, self.centroids, centroids))
+        # Half the distance between every pair of centroids, and to the nearest other one
+        half = [[0.0] * k for i in range(k)]
+        for i in range(k):
+            for j in range(i + 1, k):
+                half[i][j] = half[j][i] = dist(centroids[i], centroids[j]) / 2
+        nearest_half = [min(row[:i] + row[i + 1:], default=0.0) for i, row in enumerate(half)]
+
+        labels, upper, lower = self.labels, self.upper, self.lower
+        evaluations = 0
+        for x, point in enumerate(data):
+            bounds = lower[x]
+            for j in range(k):
+                bounds[j] = max(0.0, bounds[j] - shifts[j])
+            a = labels[x]
+            u = upper[x] + shifts[a]
+            is_tight = shifts[a] == 0.0  # every bound is exact after the previous call
+            if u > nearest_half[a]:
+                for j in range(k):
+                    if j == a or u <= bounds[j] or u <= half[a][j]:
+                        continue
+                    if not is_tight:
+                        u = bounds[a] = dist(point, centroids[a])
+                        evaluations += 1
+                        is_tight = True
+                        if u <= bounds[j] or u <= half[a][j]:
+                            continue
+                    d = bounds[j] = dist(point, centroids[j])
+                    evaluations += 1
+                    if d < u:
+                        a, u = j, d
+            if not is_tight:
+                # The inertia needs the exact distance; it also tightens the bound for next time
+                u = bounds[a] = dist(point, centroids[a])
+                evaluations += 1
+            labels[x] = a
+            upper[x] = u
+        self.evaluations += evaluations
+        self.skipped += len(data) * k - evaluations
+
+
+if __name__ == "__main__":
+    from random import Random
+
+    from kmeans import k_means_fit
+
+    rng = Random(0)
+    centres = [tuple(rng.uniform(0, 100) for d in range(10)) for c in range(25)]
+    data = [tuple(rng.gauss(x, 5) for x in rng.choice(centres)) for i in range(2000)]
+
+    engine = ElkanAssigner()
+    fast = k_means_fit(data, k=25, init='k-means++', seed=1, assign=engine)
+    plain = k_means_fit(data, k=25, init='k-means++', seed=1)
+    assert fast.labels == plain.labels
+
+    total = engine.evaluations + engine.skipped
+    print(f'{fast.iterations} iterations, {engine.evaluations} of {total} distances evaluated '
+          f'({engine.skipped / total:.1%} skipped)')
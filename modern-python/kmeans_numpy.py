@@ -0,0 +1,260 @@
+'''NumPy backend for kmeans.py
+
+Same algorithm as ``kmeans.k_means`` but each step is a batched array
+operation instead of a Python-level ``dist`` call per point/centroid pair:
+
+- squared distances for the whole point x centroid matrix at once
+- ``argmin`` over that matrix gives the labels
+- centroids are grouped sums divided by group counts
+
+With ``missing=<value>`` those entries (e.g. congress_loader.ABSENT, a vote
+held before a senator took office) are skipped: distances are computed over
+the coordinates both sides have, scaled up by n_dims / n_observed so rows
+with gaps stay comparable, and centroids average only the observed values.
+This is still a few matrix products per iteration, not a Python loop.
+
+NumPy is an optional dependency: ``kmeans.py`` keeps working without it.
+'''
+
+from typing import Dict, Iterable, List, Optional, Sequence
+from random import Random
+import random
+
+import numpy as np
+
+from kmeans import Point, Centroid, KMeansResult, best_of_restarts
+
+
+def as_array(data: Iterable[Point], missing: Optional[float]=None) -> np.ndarray:
+    'Convert points to a 2-d float64 array (one row per point); missing values become NaN'
+    if isinstance(data, np.ndarray):
+        X = np.asarray(data, dtype=np.float64).reshape(len(data), -1)  # no copy of a float64 array
+    else:
+        X = np.array(list(data), dtype=np.float64, ndmin=2)
+    if missing is not None:
+        X = np.where(X == missing, np.nan, X)  # a new array: the caller's data is left as it was
+    return X
+
+
+def squared_distances(centroids: Sequence[Point], data: Iterable[Point]) -> np.ndarray:
+    'Matrix of squared Euclidean distances, shape (n_points, n_centroids)'
+    X = as_array(data)
+    C = as_array(centroids)
+    # |x - c|^2 = |x|^2 - 2 x.c + |c|^2, a single matrix product for all pairs
+    d2 = (X * X).sum(axis=1)[:, None] - 2.0 * (X @ C.T) + (C * C).sum(axis=1)[None, :]
+    return np.maximum(d2, 0.0, out=d2)
+
+
+def observed_means(X: np.ndarray) -> np.ndarray:
+    'Mean of the non-NaN values of each column (0.0 for a column with none)'
+    observed = ~np.isnan(X)
+    counts = observed.sum(axis=0)
+    sums = np.where(observed, X, 0.0).sum(axis=0)
+    return np.where(counts > 0, sums / np.maximum(counts, 1), 0.0)
+
+
+def masked_squared_distances(centroids: Sequence[Point], X: np.ndarray) -> np.ndarray:
+    '''Squared distances that skip the NaN coordinates of X, shape (n_points, n_centroids)
+
+    Each row's sum over its observed coordinates is scaled by
+    n_dims / n_observed, so a point with gaps isn't artificially close.
+    '''
+    C = as_array(centroids)
+    observed = ~np.isnan(X)
+    M = observed.astype(np.float64)
+    X0 = np.where(observed, X, 0.0)
+    # sum_j m_ij (x_ij - c_j)^2 = sum m x^2 - 2 (m x).c + m.(c^2): three products, no loop over points
+    d2 = (X0 * X0).sum(axis=1)[:, None] - 2.0 * (X0 @ C.T) + M @ (C * C).T
+    np.maximum(d2, 0.0, out=d2)
+    n_observed = M.sum(axis=1)
+    scale = np.where(n_observed > 0, X.shape[1] / np.maximum(n_observed, 1.0), 0.0)
+    return d2 * scale[:, None]
+
+
+def assign_labels(centroids: Sequence[Point], data: Iterable[Point], chunk_size: int=65536) -> np.ndarray:
+    'Index of the closest centroid for every point'
+    X = as_array(data)
+    C = as_array(centroids)
+    c2 = (C * C).sum(axis=1)
+    labels = np.empty(len(X), dtype=np.intp)
+    # Chunk the rows so the distance matrix stays at chunk_size x k floats
+    for start in range(0, len(X), chunk_size):
+        block = X[start:start + chunk_size]
+        # |x|^2 is the same for every centroid, so it can't change the argmin
+        labels[start:start + chunk_size] = (c2[None, :] - 2.0 * (block @ C.T)).argmin(axis=1)
+    return labels
+
+
+def compute_centroids(data: Iterable[Point], labels: np.ndarray, k: int,
+                      weights: Optional[np.ndarray]=None) -> np.ndarray:
+    '(Weighted) mean of the points in each group, shape (k, n_dims); empty groups are NaN'
+    X = as_array(data)
+    if weights is None:
+        counts = np.bincount(labels, minlength=k).astype(np.float64)
+    else:
+        counts = np.bincount(labels, weights=weights, minlength=k)
+        X = X * weights[:, None]
+    # One bincount per dimension is a grouped sum without a Python loop over points
+    sums = np.column_stack([np.bincount(labels, weights=column, minlength=k) for column in X.T])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts[:, None]
+
+
+def masked_compute_centroids(X: np.ndarray, labels: np.ndarray, k: int,
+                             weights: Optional[np.ndarray]=None) -> np.ndarray:
+    'Per-group mean of the observed (non-NaN) values of each coordinate; NaN where a group has none'
+    observed = ~np.isnan(X)
+    X0 = np.where(observed, X, 0.0)
+    if weights is not None:
+        observed = observed * weights[:, None]
+        X0 = X0 * weights[:, None]
+    counts = np.column_stack([np.bincount(labels, weights=column, minlength=k) for column in observed.T])
+    sums = np.column_stack([np.bincount(labels, weights=column, minlength=k) for column in X0.T])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts
+
+
+def nearest(centroids: np.ndarray, X: np.ndarray, missing: bool=False,
+            weights: Optional[np.ndarray]=None):
+    'Labels and (weighted) inertia; with missing=True the NaN coordinates of X are skipped'
+    if missing:
+        d2 = masked_squared_distances(centroids, X)
+        labels = d2.argmin(axis=1)
+        closest = d2[np.arange(len(X)), labels]
+    else:
+        labels = assign_labels(centroids, X)
+        diff = X - centroids[labels]
+        closest = np.einsum('ij,ij->i', diff, diff)
+    if weights is not None:
+        closest = closest * weights
+    return labels, float(closest.sum())
+
+
+def assign_data(centroids: Sequence[Point], data: Iterable[Point]) -> Dict[Centroid, List[Point]]:
+    'Group the data points to the closest centroid (same shape as kmeans.assign_data)'
+    points = data if isinstance(data, np.ndarray) else list(data)
+    centroids = [tuple(c) for c in centroids]
+    labels = assign_labels(centroids, points)
+    d = {}  # type: Dict[Centroid, List[Point]]
+    for point, label in zip(points, labels.tolist()):
+        d.setdefault(centroids[label], []).append(point)
+    return d
+
+
+def k_means_plus_plus(X: np.ndarray, k: int, rng=random, missing: bool=False,
+                      weights: Optional[np.ndarray]=None) -> np.ndarray:
+    'k-means++ seeding; the closest-seed distances are updated one array operation per seed'
+    if missing:
+        fill = observed_means(X)  # a seed can't have gaps
+        seed_row = lambda i: np.where(np.isnan(X[i]), fill, X[i])
+        to_seed = lambda i: masked_squared_distances(seed_row(i)[None, :], X)[:, 0]
+    else:
+        seed_row = lambda i: X[i]
+        to_seed = lambda i: ((X - X[i]) ** 2).sum(axis=1)
+
+    def draw(odds: np.ndarray) -> int:
+        # Same draw as rng.choices(weights=odds) but the cumulative sum is vectorized
+        index = int(np.searchsorted(odds.cumsum(), rng.random() * odds.sum(), side='right'))
+        return min(index, len(X) - 1)
+
+    chosen = [rng.randrange(len(X)) if weights is None else draw(weights)]
+    closest = to_seed(chosen[0])
+    while len(chosen) < k:
+        odds = closest if weights is None else closest * weights
+        if odds.sum() > 0:
+            index = draw(odds)
+        else:
+            index = rng.randrange(len(X))  # fewer distinct points than k
+        chosen.append(index)
+        np.minimum(closest, to_seed(index), out=closest)
+    return np.array([seed_row(i) for i in chosen])
+
+
+def initial_centroids(X: np.ndarray, k: int, init='k-means++', rng=random, missing: bool=False,
+                      weights: Optional[np.ndarray]=None) -> np.ndarray:
+    'Seed centroids with "random", "k-means++", or an explicit list of centroids'
+    if init == 'random':
+        centroids = X[rng.sample(range(len(X)), k)]
+        if missing:
+            centroids = np.where(np.isnan(centroids), observed_means(X), centroids)
+        return centroids.copy()
+    if init == 'k-means++':
+        return k_means_plus_plus(X, k, rng, missing, weights)
+    if isinstance(init, str):
+        raise ValueError(f'Unknown init method: {init!r}')
+    return as_array(init).copy()
+
+
+def k_means_fit(data: Iterable[Point], k: int=2, iterations: int=50, tol: float=0.0,
+                init='random', seed: Optional[int]=None, n_init: int=1,
+                workers: Optional[int]=None, missing: Optional[float]=None,
+                weights: Optional[Sequence[float]]=None) -> KMeansResult:
+    '''Same stopping rule and restarts as kmeans.k_means_fit; centroids and
+    labels are returned as arrays so no per-point Python objects are built
+
+    Coordinates equal to missing (or NaN, once missing is given) are
+    skipped by the distances and the centroid means. weights (e.g. the
+    counts from kmeans.deduplicate()) count each point that many times.
+    '''
+    X = as_array(data, missing)
+    skip = missing is not None
+    if weights is not None:
+        weights = np.asarray(weights, dtype=np.float64)
+    if n_init > 1:
+        return best_of_restarts(k_means_fit, X, n_init, workers, seed, k=k, iterations=iterations,
+                                tol=tol, init=init, missing=np.nan if skip else None, weights=weights)
+    rng = random if seed is None else Random(seed)
+    centroids = initial_centroids(X, k, init, rng, skip, weights)
+    previous = None
+    labels = np.zeros(0, dtype=np.intp)
+    inertia = []
+    converged = False
+    iteration = 0
+    for iteration in range(1, iterations + 1):
+        labels, total = nearest(centroids, X, skip, weights)
+        inertia.append(total)
+        if previous is not None and np.array_equal(labels, previous):
+            converged = True
+            break
+        if skip:
+            new_centroids = masked_compute_centroids(X, labels, k, weights)
+        else:
+            new_centroids = compute_centroids(X, labels, k, weights)
+        # An empty group (or a coordinate no member has) keeps its previous value
+        empty = np.isnan(new_centroids)
+        new_centroids[empty] = centroids[empty]
+        shift = np.sqrt(((new_centroids - centroids) ** 2).sum(axis=1)).max()
+        centroids, previous = new_centroids, labels
+        if shift <= tol:
+            converged = True
+            labels, total = nearest(centroids, X, skip, weights)
+            inertia.append(total)
+            break
+    else:
+        # Budget spent: the centroids moved after the last labelling, label the data with them
+        labels, total = nearest(centroids, X, skip, weights)
+        inertia.append(total)
+    return KMeansResult(centroids, labels, inertia, iteration, converged)
+
+
+def k_means(data: Iterable[Point], k: int=2, iterations: int=50, tol: float=0.0, **kwargs) -> List[Centroid]:
+    centroids = k_means_fit(data, k, iterations, tol, **kwargs).centroids
+    return [tuple(c) for c in centroids.tolist()]
+
+if __name__ == "__main__":
+    from pprint import pprint
+
+    points = [
+        (10, 41, 23),
+        (22, 30, 29),
+        (11, 42, 5),
+        (20, 32, 4),
+        (12, 40, 12),
+        (21, 36, 23),
+    ]
+
+    centroids = k_means(points, k=3)
+
+    d = assign_data(centroids, points)
+
+    pprint(d, width=50)
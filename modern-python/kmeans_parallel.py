@@ -0,0 +1,284 @@
+'''Multi-core assignment step for k-means: the points split into shards across a process pool
+
+The points are copied once into a ``multiprocessing.shared_memory`` block
+that every worker maps, so the data is never pickled; a second block holds
+the labels. Each iteration only sends the centroids: every worker labels
+its contiguous shard of points, writes the labels in place in the shared
+label array, and returns the shard's per-cluster weights and column sums,
+inertia and number of changed labels. The parent merges the partial sums
+into the new centroids. Float sums travel as fsum "parts" (see
+fsum_parts) so the merged means are still exactly rounded; integer sums
+(votes) are plain ints. Per iteration the
+traffic is O(shards * k * dims), whatever the number of points, so the
+work scales with the number of cores until a shard gets too small to
+amortise a round trip.
+
+    >>> result = k_means_fit(data, k=8, workers=32)         # same result as kmeans.k_means_fit
+    >>> with ShardedAssigner(data, workers=8) as assign:     # or as a drop-in assign= step
+    ...     result = kmeans.k_means_fit(data, k=8, assign=assign)
+'''
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from array import array
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from math import fsum, isfinite
+from multiprocessing.shared_memory import SharedMemory
+from operator import mul, ne
+from random import Random
+import os
+import random
+
+from kmeans import Point, Centroid, KMeansResult, dist, initial_centroids, nearest
+from pointstore import PointStore
+
+# Per cluster: None if it got no points, else (parts of its total weight, parts of each column's weighted sum)
+Sums = List[Optional[Tuple[list, List[list]]]]
+
+_shared = None  # type: Optional[tuple]
+
+
+def is_integral(data: Iterable[Point], weights: Optional[Iterable[float]]=None) -> bool:
+    'True if every coordinate (and weight) is an int, so the sums can be exact ints'
+    return (all(isinstance(x, int) for point in data for x in point)
+            and (weights is None or all(isinstance(w, int) for w in weights)))
+
+
+def fsum_parts(values: Sequence[float]) -> List[float]:
+    '''Floats whose exact sum is the exact sum of values
+
+    The first part is fsum(values), each next one the exactly rounded
+    remainder, until nothing remains (usually two or three C fsum passes).
+    fsum over the parts of several shards together is then the exactly
+    rounded sum of all their values, as one fsum over everything would be.
+    '''
+    parts = []  # type: List[float]
+    while True:
+        part = fsum(chain(values, [-p for p in parts]))
+        if not part or not isfinite(part):
+            return parts + [part] if part else parts
+        parts.append(part)
+
+
+def shard_sums(data: Sequence[Point], labels: Sequence[int], k: int,
+               weights: Optional[Sequence[float]]=None, exact: bool=False) -> Sums:
+    'Per-cluster weight and column sums of a shard, grouped as in kmeans.update_centroids'
+    parts = (lambda values: [sum(values)]) if exact else fsum_parts
+    groups = [[] for i in range(k)]  # type: List[List[Point]]
+    for point, label in zip(data, labels):
+        groups[label].append(point)
+    if weights is not None:
+        group_weights = [[] for i in range(k)]  # type: List[List[float]]
+        for w, label in zip(weights, labels):
+            group_weights[label].append(w)
+    sums = []  # type: Sums
+    for i, group in enumerate(groups):
+        if not group:
+            sums.append(None)
+        elif weights is None:
+            sums.append(([len(group)], [parts(column) for column in zip(*group)]))
+        else:
+            w = group_weights[i]
+            sums.append((parts(w), [parts(list(map(mul, column, w))) for column in zip(*group)]))
+    return sums
+
+
+def merge_sums(shards: Sequence[Sums], centroids: Sequence[Centroid], exact: bool=False) -> List[Centroid]:
+    'New centroids from the sums of every shard; a cluster no shard has points for keeps its old centroid'
+    total = sum if exact else fsum
+    result = []
+    for i, old in enumerate(centroids):
+        found = [sums[i] for sums in shards if sums[i] is not None]
+        if not found:
+            result.append(tuple(old))
+            continue
+        weight = total(chain.from_iterable(weight_parts for weight_parts, columns in found))
+        columns = zip(*[columns for weight_parts, columns in found])
+        result.append(tuple([total(chain.from_iterable(parts)) / weight for parts in columns]))
+    return result
+
+
+def _attach(name: str, typecode: str, count: int) -> Tuple[SharedMemory, memoryview]:
+    'Map a shared block and view its first count items (the block may be rounded up to a page)'
+    block = SharedMemory(name)
+    return block, block.buf[:count * array(typecode).itemsize].cast(typecode)
+
+
+def _init_worker(layout: tuple) -> None:
+    global _shared
+    (points_name, typecode, count, dims, labels_name, weights_name, metric, exact) = layout
+    blocks = []
+    block, values = _attach(points_name, typecode, count * dims)
+    blocks.append(block)
+    block, labels = _attach(labels_name, 'i', count)
+    blocks.append(block)
+    weights = None
+    if weights_name is not None:
+        block, weights = _attach(weights_name, 'd', count)
+        blocks.append(block)
+    # The blocks stay referenced for the life of the worker: their views must outlive them
+    _shared = blocks, values, dims, labels, weights, metric, exact
+
+
+def _assign_shard(centroids: List[Centroid], start: int, stop: int) -> Tuple[Sums, float, int]:
+    'Label points start..stop in the shared label array; their partial sums, inertia and changed labels'
+    blocks, values, dims, labels, weights, metric, exact = _shared
+    shard = PointStore.from_array(values[start * dims:stop * dims], dims)
+    shard_weights = weights[start:stop] if weights is not None else None
+    new_labels, inertia = nearest(centroids, shard, shard_weights, metric)
+    changed = sum(map(ne, labels[start:stop], new_labels))
+    labels[start:stop] = array('i', new_labels)
+    return shard_sums(shard, new_labels, len(centroids), shard_weights, exact), inertia, changed
+
+
+class ShardedAssigner:
+    '''Process pool that labels shards of one dataset held in shared memory
+
+    step(centroids) returns the new centroids from the merged shard sums,
+    the inertia and the number of labels that changed; calling the assigner like kmeans.nearest
+    makes it a drop-in assign= step for kmeans.k_means_fit. Close it (or
+    use it as a context manager) to stop the workers and free the memory.
+    '''
+
+    def __init__(self, data: Sequence[Point], workers: Optional[int]=None,
+                 weights: Optional[Sequence[float]]=None, metric=dist, shards: Optional[int]=None):
+        self.data = data
+        self.weights = weights
+        self.count = count = len(data)
+        self.dims = dims = len(data[0]) if count else 0
+        self.exact = is_integral(data, weights)
+        self.workers = workers or os.cpu_count() or 1
+        shards = min(shards or self.workers, count) or 1
+        self.bounds = [(i * count // shards, (i + 1) * count // shards) for i in range(shards)]
+        self._blocks = []  # type: List[SharedMemory]
+
+        if isinstance(data, PointStore):
+            typecode, values = data.view.format, data.view
+        else:
+            typecode = 'q' if is_integral(data) else 'd'
+            values = memoryview(array(typecode, chain.from_iterable(data)))
+        points = self._share(values.cast('B'))
+        labels = self._share(memoryview(array('i', [-1]) * count).cast('B'))  # -1: no label yet
+        weights_name = None
+        if weights is not None:
+            weights_name = self._share(memoryview(array('d', weights)).cast('B')).name
+        self._labels = labels.buf[:4 * count].cast('i')
+        layout = (points.name, typecode, count, dims, labels.name, weights_name, metric, self.exact)
+        self.executor = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(layout,))
+
+    def _share(self, data) -> SharedMemory:
+        'Copy bytes into a new shared memory block'
+        block = SharedMemory(create=True, size=max(len(data), 1))
+        block.buf[:len(data)] = data
+        self._blocks.append(block)
+        return block
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(<{self.count} x {self.dims}>, '
+                f'workers={self.workers}, shards={len(self.bounds)})')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        self.executor.shutdown()
+        self._labels.release()
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    @property
+    def labels(self) -> List[int]:
+        'Label of every point after the last step'
+        return self._labels.tolist()
+
+    def step(self, centroids: Sequence[Centroid]) -> Tuple[List[Centroid], float, int]:
+        'Label every point: (new centroids, inertia, number of labels that changed)'
+        centroids = [tuple(centroid) for centroid in centroids]
+        futures = [self.executor.submit(_assign_shard, centroids, start, stop) for start, stop in self.bounds]
+        results = [future.result() for future in futures]  # merged in shard order: deterministic
+        sums, inertias, changes = zip(*results)
+        return merge_sums(sums, centroids, self.exact), fsum(inertias), sum(changes)
+
+    def __call__(self, centroids: Sequence[Centroid], data: Optional[Sequence[Point]]=None,
+                 weights: Optional[Sequence[float]]=None) -> Tuple[List[int], float]:
+        'Index of the closest centroid for each point, plus the (weighted) inertia, like kmeans.nearest'
+        if data is not None and data is not self.data or weights is not None and weights is not self.weights:
+            raise ValueError('ShardedAssigner holds another dataset: create one per data and weights')
+        new_centroids, inertia, changed = self.step(centroids)
+        return self.labels, inertia
+
+
+def assign_data(centroids: Sequence[Centroid], data: Sequence[Point], workers: Optional[int]=None,
+                metric=dist) -> Dict[Centroid, List[Point]]:
+    'kmeans.assign_data with the points labelled in parallel shards'
+    with ShardedAssigner(data, workers, metric=metric) as assigner:
+        labels, inertia = assigner(centroids)
+    centroids = [tuple(centroid) for centroid in centroids]
+    d = defaultdict(list)
+    for point, label in zip(data, labels):
+        d[centroids[label]].append(point)
+    return dict(d)
+
+
+def k_means_fit(data: Sequence[Point], k: int=2, iterations: int=50, tol: float=0.0,
+                init='random', seed: Optional[int]=None, workers: Optional[int]=None,
+                weights: Optional[Sequence[float]]=None, metric=dist) -> KMeansResult:
+    '''kmeans.k_means_fit with each iteration's labels and centroid sums computed in parallel shards
+
+    Same stopping rules, and for the same seed the same result, as the
+    serial version. The pool is started once per fit; the new centroids
+    come straight from the merged shard sums, so the parent never walks
+    the data.
+    '''
+    if not isinstance(data, Sequence):
+        data = list(data)
+    rng = random if seed is None else Random(seed)
+    centroids = initial_centroids(data, k, init, rng, weights)
+    inertia = []
+    converged = False
+    iteration = 0
+    with ShardedAssigner(data, workers, weights, metric) as assigner:
+        for iteration in range(1, iterations + 1):
+            new_centroids, total, changed = assigner.step(centroids)
+            inertia.append(total)
+            if not changed:
+                converged = True
+                break
+            shift = max(map(dist, centroids, new_centroids))
+            centroids = new_centroids
+            if shift <= tol:
+                converged = True
+                inertia.append(assigner.step(centroids)[1])
+                break
+        else:
+            # Budget spent: the centroids moved after the last labelling, label the data with them
+            inertia.append(assigner.step(centroids)[1])
+        labels = assigner.labels
+    return KMeansResult(centroids, labels, inertia, iteration, converged)
+
+
+if __name__ == "__main__":
+    from time import perf_counter
+
+    import kmeans
+    from bench_kmeans import make_blobs
+
+    data = make_blobs(20000, 10, 8, seed=0)
+    start = perf_counter()
+    serial = kmeans.k_means_fit(data, k=8, seed=0, iterations=10)
+    baseline = perf_counter() - start
+    print(f'serial:     {baseline:.2f}s')
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        start = perf_counter()
+        result = k_means_fit(data, k=8, seed=0, iterations=10, workers=workers)
+        seconds = perf_counter() - start
+        assert result.labels == serial.labels
+        print(f'workers={workers:<3} {seconds:.2f}s  {baseline / seconds:.2f}x')
+        workers *= 2
@@ -0,0 +1,107 @@
+'''Mini-batch (streaming) k-means
+
+``kmeans.k_means`` needs the whole dataset in a list and touches every
+point on every iteration. Here points are consumed from any iterator in
+fixed-size chunks; each chunk is assigned to the current centroids and
+every centroid moves towards its new points with a per-centroid learning
+rate of 1 / (points seen so far), so it stays the running mean of
+everything assigned to it (Sculley, "Web-Scale K-Means Clustering", 2010).
+
+Only one batch is held in memory at a time: batch_size x n_dims numbers,
+plus k centroids and k counts.
+'''
+
+from typing import Iterable, Iterator, List, Optional
+from itertools import islice
+from random import Random
+import random
+
+from kmeans import Point, Centroid, nearest, k_means_plus_plus
+
+
+def batches(data: Iterable[Point], batch_size: int) -> Iterator[List[Point]]:
+    'Split an iterable of points into lists of at most batch_size points'
+    it = iter(data)
+    while True:
+        batch = list(islice(it, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+class MiniBatchKMeans:
+    'k-means whose centroids are updated incrementally, one batch at a time'
+
+    def __init__(self, k: int=2, batch_size: int=1024, init: str='k-means++', seed: Optional[int]=None):
+        self.k = k
+        self.batch_size = batch_size
+        self.init = init
+        self.rng = random if seed is None else Random(seed)
+        self.centroids = []  # type: List[List[float]]
+        self.counts = []     # type: List[int]
+        self.batch_inertia = []  # type: List[float]
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(k={self.k}, batch_size={self.batch_size}, seen={sum(self.counts)})'
+
+    def _seed(self, batch: List[Point]) -> None:
+        if len(batch) < self.k:
+            raise ValueError(f'The first batch needs at least k={self.k} points, got {len(batch)}')
+        if self.init == 'k-means++':
+            seeds = k_means_plus_plus(batch, self.k, self.rng)
+        else:
+            seeds = self.rng.sample(batch, self.k)
+        self.centroids = [list(map(float, seed)) for seed in seeds]
+        self.counts = [0] * self.k
+
+    def partial_fit(self, batch: Iterable[Point]) -> 'MiniBatchKMeans':
+        'Fold one batch of points into the centroids'
+        batch = list(batch)
+        if not batch:
+            return self
+        if not self.centroids:
+            self._seed(batch)
+        labels, inertia = nearest(self.centroids, batch)
+        self.batch_inertia.append(inertia)
+        centroids, counts = self.centroids, self.counts
+        for point, label in zip(batch, labels):
+            counts[label] += 1
+            eta = 1.0 / counts[label]
+            centroid = centroids[label]
+            for i, x in enumerate(point):
+                centroid[i] += eta * (x - centroid[i])
+        return self
+
+    def fit(self, data: Iterable[Point]) -> 'MiniBatchKMeans':
+        'One streaming pass over data, batch_size points at a time'
+        for batch in batches(data, self.batch_size):
+            self.partial_fit(batch)
+        return self
+
+    @property
+    def cluster_centers(self) -> List[Centroid]:
+        return [tuple(centroid) for centroid in self.centroids]
+
+    def predict(self, data: Iterable[Point]) -> Iterator[int]:
+        'Label of the closest centroid for each point, computed lazily batch by batch'
+        for batch in batches(data, self.batch_size):
+            yield from nearest(self.centroids, batch)[0]
+
+
+if __name__ == "__main__":
+    from pprint import pprint
+
+    def stream(n, seed=0):
+        'Simulated feed of points around three centres'
+        rng = Random(seed)
+        centres = [(10, 41, 23), (22, 30, 29), (20, 32, 4)]
+        for i in range(n):
+            x, y, z = rng.choice(centres)
+            yield (x + rng.gauss(0, 1), y + rng.gauss(0, 1), z + rng.gauss(0, 1))
+
+    model = MiniBatchKMeans(k=3, batch_size=100, seed=1).fit(stream(10_000))
+    pprint(model.cluster_centers)
+
+    # New records arrive later: fold them in without reclustering from scratch
+    model.partial_fit(stream(100, seed=2))
+    print(model)
@@ -0,0 +1,124 @@
+'''Compact, row-major storage for k-means points
+
+A ``Point`` is a tuple of boxed Python objects: 56 bytes of tuple header
+plus an 8-byte pointer per coordinate, plus the number objects themselves.
+A PointStore keeps every coordinate in one contiguous typed ``array``
+(1 byte per vote with typecode 'b', 8 bytes per float with 'd') and hands
+out rows as ``memoryview`` slices, so reading a row copies nothing.
+
+PointStore is a Sequence of rows, which is all ``kmeans.k_means_fit``,
+``kmeans.assign_data`` and ``kmeans.compute_centroids`` need:
+
+    >>> store = PointStore(record.values(), typecode='b')
+    >>> result = k_means_fit(store, k=3)
+
+``columns()`` gives each coordinate column as a strided view of the same
+array, and ``kmeans.update_centroids`` reads those instead of grouping
+rows and transposing them. The store saves memory, not time, though:
+every coordinate read from the array makes a new Python number, where a
+tuple hands out the ones it holds, so a centroid update on a store takes
+1 to 1.5x as long as on tuples.
+'''
+
+from typing import Iterable, Iterator, List
+from array import array
+from collections.abc import Sequence
+import sys
+
+from kmeans import Point
+
+
+class PointStore(Sequence):
+    'Sequence of equal-length points backed by one contiguous typed array'
+
+    def __init__(self, data: Iterable[Point], typecode: str='d'):
+        values = array(typecode)
+        dims = None
+        count = 0
+        for point in data:
+            values.extend(point)
+            count += 1
+            if dims is None:
+                dims = len(values)
+            elif len(values) != count * dims:
+                raise ValueError(f'Point #{count - 1} has {len(values) - (count - 1) * dims} '
+                                 f'coordinates, expected {dims}')
+        self._attach(values, dims or 0)
+
+    def _attach(self, values: array, dims: int) -> None:
+        self.values = values
+        self.dims = dims
+        self.count = len(values) // dims if dims else 0
+        self.view = memoryview(values)  # exported, so values can no longer be resized
+
+    @classmethod
+    def from_array(cls, values, dims: int) -> 'PointStore':
+        'Wrap an existing row-major array (or any 1-d buffer, e.g. an mmap view) without copying it'
+        store = cls.__new__(cls)
+        store._attach(values, dims)
+        return store
+
+    def __reduce__(self):
+        # memoryviews can't be pickled; rebuild from the array (e.g. in worker processes)
+        return (self.from_array, (self.values, self.dims))
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(<{self.count} x {self.dims} {self.view.format!r}>)'
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('PointStore index out of range')
+        start = index * self.dims
+        return self.view[start:start + self.dims]
+
+    def __iter__(self) -> Iterator[memoryview]:
+        view, dims = self.view, self.dims
+        for start in range(0, self.count * dims, dims):
+            yield view[start:start + dims]
+
+    def columns(self) -> List[memoryview]:
+        'Every coordinate column as a strided view of the array: nothing is copied'
+        return [self.view[j::self.dims] for j in range(self.dims)]
+
+    @property
+    def nbytes(self) -> int:
+        return self.view.nbytes
+
+
+def tuple_bytes(points: Iterable[Point]) -> int:
+    'Memory held by a collection of tuple points: the tuples plus every distinct number object'
+    total = 0
+    seen = set()
+    for point in points:
+        total += sys.getsizeof(point)
+        for x in point:
+            if id(x) not in seen:
+                seen.add(id(x))
+                total += sys.getsizeof(x)
+    return total
+
+
+def store_bytes(store: PointStore) -> int:
+    'Memory held by a PointStore: the array buffer plus the fixed object overhead'
+    return sys.getsizeof(store.values) + sys.getsizeof(store.view) + sys.getsizeof(store)
+
+
+if __name__ == "__main__":
+    from random import Random
+
+    rng = Random(0)
+    votes = [tuple(rng.choice((-1, 0, 1)) for j in range(500)) for i in range(100)]
+    floats = [tuple(rng.gauss(0, 1) for j in range(30)) for i in range(10_000)]
+
+    for name, points, typecode in [('votes', votes, 'b'), ('floats', floats, 'd')]:
+        store = PointStore(points, typecode)
+        before = tuple_bytes(points) / len(points)
+        after = store_bytes(store) / len(points)
+        print(f'{name:>6} {store!r}: {before:,.0f} -> {after:,.0f} bytes per point')
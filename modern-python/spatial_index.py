@@ -0,0 +1,235 @@
+'''Nearest-neighbour index over points or centroids: KD-tree with a brute-force fallback
+
+"Which centroid is closest to this new vote history?" or "which senators
+vote most like it?" are a linear scan with ``kmeans.dist``. A KD-tree
+splits the points on the median of their widest coordinate, recursively,
+down to small leaves; a query descends to the leaf of the query point and
+only visits another branch when the splitting plane is closer than the
+worst neighbour found so far. With few dimensions that skips most of the
+points. With many (e.g. 28 votes) almost every branch is visited, so
+``build_index`` falls back to a batched brute-force scan when 2 ** dims
+exceeds the number of points.
+
+Both indexes answer k-nearest-neighbour and radius queries for a batch of
+query points, ties broken by the lower index, like ``kmeans.nearest``:
+
+    >>> index = build_index(record.values())
+    >>> index.query([new_history], k=5)[0].indices     # rows of the 5 most similar senators
+    >>> index.query_radius(centroids, 2.0)
+
+``IndexAssigner`` is an ``assign=`` step for ``kmeans.k_means_fit`` that
+builds the index over the centroids each iteration, which pays off when k
+is large:
+
+    >>> result = k_means_fit(data, k=500, assign=IndexAssigner())
+'''
+
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
+from bisect import bisect_left, bisect_right
+from heapq import heappush, heapreplace, nsmallest
+from math import fsum
+
+from kmeans import Point, Centroid, dist, manhattan
+
+Neighbors = NamedTuple('Neighbors', [('distances', List[float]), ('indices', List[int])])
+
+# Internal node: (dimension, split value, left, right); leaf: list of point indices
+Node = Union[tuple, List[int]]
+
+
+class BruteForceIndex:
+    'Exact neighbours by computing the distance from each query to every point'
+
+    def __init__(self, points: Sequence[Point], metric=dist):
+        self.points = list(points)
+        self.metric = metric
+        self.evaluations = 0
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(<{len(self.points)} points>, evaluations={self.evaluations})'
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def _distances(self, query: Point) -> List[float]:
+        self.evaluations += len(self.points)
+        metric = self.metric
+        return [metric(query, point) for point in self.points]
+
+    def query(self, queries: Sequence[Point], k: int=1) -> List[Neighbors]:
+        'The k nearest points to each query, nearest first'
+        results = []
+        indices = range(len(self.points))
+        for query in queries:
+            distances = self._distances(query)
+            nearest = nsmallest(k, indices, key=distances.__getitem__)  # stable: lower index on ties
+            results.append(Neighbors([distances[i] for i in nearest], nearest))
+        return results
+
+    def query_radius(self, queries: Sequence[Point], radius: float) -> List[Neighbors]:
+        'Every point within radius of each query, nearest first'
+        results = []
+        for query in queries:
+            distances = self._distances(query)
+            within = sorted((d, i) for i, d in enumerate(distances) if d <= radius)
+            results.append(Neighbors([d for d, i in within], [i for d, i in within]))
+        return results
+
+
+class KDTree(BruteForceIndex):
+    '''Exact neighbours from a KD-tree with leaves of at most leaf_size points
+
+    The pruning bound is the distance to the splitting plane along one
+    coordinate, a lower bound for ``dist`` and ``manhattan`` (any metric that
+    is at least as large as every single coordinate difference).
+    '''
+
+    def __init__(self, points: Sequence[Point], metric=dist, leaf_size: int=16):
+        super().__init__(points, metric)
+        self.leaf_size = leaf_size
+        self.dims = len(self.points[0]) if self.points else 0
+        self.root = self._build(list(range(len(self.points))))
+
+    def _build(self, indices: List[int]) -> Node:
+        if len(indices) <= self.leaf_size:
+            return indices
+        points = self.points
+        spreads = [max(points[i][d] for i in indices) - min(points[i][d] for i in indices)
+                   for d in range(self.dims)]
+        dim = max(range(self.dims), key=spreads.__getitem__)
+        if not spreads[dim]:
+            return indices  # all duplicates: nothing to split
+        indices.sort(key=lambda i: points[i][dim])
+        keys = [points[i][dim] for i in indices]
+        # Left gets the values < split, right the values >= split; equal values never straddle
+        middle = bisect_left(keys, keys[len(keys) // 2]) or bisect_right(keys, keys[0])
+        split = keys[middle]
+        return dim, split, self._build(indices[:middle]), self._build(indices[middle:])
+
+    def _search(self, node: Node, query: Point, visit) -> float:
+        'Call visit(leaf) on the leaves in order of the query side first; visit returns the pruning bound'
+        if isinstance(node, list):
+            return visit(node)
+        dim, split, left, right = node
+        gap = query[dim] - split
+        near, far = (left, right) if gap < 0 else (right, left)
+        bound = self._search(near, query, visit)
+        if abs(gap) <= bound:  # not < : a tie on the far side may have a lower index
+            bound = self._search(far, query, visit)
+        return bound
+
+    def query(self, queries: Sequence[Point], k: int=1) -> List[Neighbors]:
+        'The k nearest points to each query, nearest first'
+        k = min(k, len(self.points))
+        points, metric = self.points, self.metric
+        results = []
+        for query in queries:
+            heap = []  # type: List[Tuple[float, int]]
+            # (-distance, -index) pairs: the worst neighbour found so far is on top
+
+            def visit(leaf):
+                self.evaluations += len(leaf)
+                for i in leaf:
+                    d = metric(query, points[i])
+                    if len(heap) < k:
+                        heappush(heap, (-d, -i))
+                    elif (d, i) < (-heap[0][0], -heap[0][1]):
+                        heapreplace(heap, (-d, -i))
+                return -heap[0][0] if len(heap) == k else float('inf')
+
+            if k:
+                self._search(self.root, query, visit)
+            found = sorted((-d, -i) for d, i in heap)
+            results.append(Neighbors([d for d, i in found], [i for d, i in found]))
+        return results
+
+    def query_radius(self, queries: Sequence[Point], radius: float) -> List[Neighbors]:
+        'Every point within radius of each query, nearest first'
+        points, metric = self.points, self.metric
+        results = []
+        for query in queries:
+            within = []  # type: List[Tuple[float, int]]
+
+            def visit(leaf):
+                self.evaluations += len(leaf)
+                for i in leaf:
+                    d = metric(query, points[i])
+                    if d <= radius:
+                        within.append((d, i))
+                return radius
+
+            if points:
+                self._search(self.root, query, visit)
+            within.sort()
+            results.append(Neighbors([d for d, i in within], [i for d, i in within]))
+        return results
+
+
+def build_index(points: Sequence[Point], method: str='auto', metric=dist,
+                leaf_size: int=16) -> BruteForceIndex:
+    '''Nearest-neighbour index over points: method is "kd_tree", "brute" or "auto"
+
+    "auto" uses the KD-tree when it can prune, i.e. for dist or manhattan
+    and fewer dimensions than log2 of the number of points.
+    '''
+    points = list(points)
+    if method == 'auto':
+        dims = len(points[0]) if points else 0
+        method = 'kd_tree' if metric in (dist, manhattan) and 2 ** dims <= len(points) else 'brute'
+    if method == 'kd_tree':
+        return KDTree(points, metric, leaf_size)
+    if method == 'brute':
+        return BruteForceIndex(points, metric)
+    raise ValueError(f'Unknown index method: {method!r}')
+
+
+class IndexAssigner:
+    '''Drop-in replacement for kmeans.nearest that looks each point up in an index of the centroids
+
+    The index is rebuilt from the centroids on every call; evaluations
+    counts the distances computed, to compare with len(data) * k.
+    '''
+
+    def __init__(self, method: str='auto', leaf_size: int=16):
+        self.method = method
+        self.leaf_size = leaf_size
+        self.evaluations = 0
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(method={self.method!r}, evaluations={self.evaluations})'
+
+    def __call__(self, centroids: Sequence[Centroid], data: Sequence[Point],
+                 weights: Optional[Sequence[float]]=None, metric=dist) -> Tuple[List[int], float]:
+        'Index of the closest centroid for each point, plus the (weighted) inertia'
+        index = build_index(centroids, self.method, metric, self.leaf_size)
+        found = index.query(data, k=1)
+        self.evaluations += index.evaluations
+        labels = [neighbors.indices[0] for neighbors in found]
+        squared = [neighbors.distances[0] ** 2 for neighbors in found]
+        if weights is not None:
+            squared = [w * d2 for w, d2 in zip(weights, squared)]
+        return labels, fsum(squared)
+
+
+if __name__ == "__main__":
+    from time import perf_counter
+
+    from bench_kmeans import make_blobs
+    from kmeans import k_means_fit
+    from vote_cache import load_matrix
+
+    # Senators who vote most like a new history: here, senator 0's with the last vote flipped
+    with load_matrix() as matrix:
+        record = matrix.record()
+    senators, histories = list(record), list(record.values())
+    index = build_index(histories)
+    probe = histories[0][:-1] + (-histories[0][-1],)
+    closest = index.query([probe], k=3)[0]
+    print(f'{index!r}:', [(senators[i].name, round(d, 2)) for d, i in zip(*closest)])
+
+    data = make_blobs(20000, 2, 200, seed=0)
+    for name, assign in [('nearest', None), ('kd_tree', IndexAssigner())]:
+        start = perf_counter()
+        kwargs = {} if assign is None else {'assign': assign}
+        result = k_means_fit(data, k=200, iterations=5, seed=0, **kwargs)
+        print(f'k=200 {name:<8} {perf_counter() - start:.2f}s  inertia={result.inertia[-1]:.1f}  {assign or ""}')
@@ -129,6 +129,25 @@ d.items()
 
 show()
 
+# # Memoize the transform
+#
+# Every lookup and assignment calls the transform again, even for a key it has seen before. `transform_dict.py`
+# has the same class with an opt-in, bounded LRU memo of `key -> transform(key)` (only for deterministic transforms)
+
+# +
+from transform_dict import TransformDict as MemoTransformDict
+
+reset()
+d = MemoTransformDict(casefold, cache_size=1024)
+for i in range(1000):
+    d['Raymond'] = 'red'
+    d['RacHel'] = 'blue'
+    d['Rachel']
+show()
+# -
+
+d.cache_info()
+
 reset();
 e = TransformDict(int)
 
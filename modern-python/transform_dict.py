@@ -0,0 +1,694 @@
+'''TransformDict from "techniques for design reviews - linkedin 2017", as a reusable module
+
+A dict that stores every key as ``transform_func(key)`` (e.g. str.casefold)
+and remembers the original key of each entry:
+
+    >>> d = TransformDict(str.casefold, {'Raymond': 'red'}, Rachel='blue')
+    >>> d['RAYMOND']
+    'red'
+    >>> d.getitem('raymond')
+    ('Raymond', 'red')
+    >>> list(d.items())
+    [('Raymond', 'red'), ('Rachel', 'blue')]
+
+It models ``untransformed key -> value``: every method of the mapping
+protocol transforms the key it is given (get, in, pop, setdefault, del,
+update, the constructor, fromkeys), and iteration, keys() and items()
+give back the original keys (the most recently assigned spelling of each).
+
+Internally it is the dict ``transformed key -> value`` plus ``keymap``,
+``transformed key -> original key``, kept in the same order. Bulk
+operations (the constructor, update, fromkeys) transform all the keys
+first, with one ``map`` call, and fill both dicts with ``dict.update``.
+
+The transform runs on every lookup and assignment. When it is expensive
+(casefolding long keys, parsing) and the same keys come back again and
+again, ``cache_size=n`` memoizes the last n distinct keys' transforms
+(least recently used are evicted; ``cache_info()`` reports hits and
+misses). Only use it with deterministic transforms: a memoized key is not
+transformed again. Keys are memoized by type too, so 1, 1.0 and True are
+transformed separately; unhashable keys are always transformed.
+
+CompactTransformDict has the same API, and only stores the original key
+of the entries the transform changed.
+
+ConcurrentTransformDict is for a table shared by threads: each entry is
+one immutable (original key, value) tuple, so readers never see a key
+from one write with the value of another, and reads take no lock.
+'''
+
+from collections.abc import ItemsView, KeysView, Mapping, MutableMapping, ValuesView
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from threading import Lock
+
+_missing = object()
+
+
+def is_hashable(key) -> bool:
+    try:
+        hash(key)
+    except TypeError:
+        return False
+    return True
+
+
+class TransformItemsView(ItemsView):
+    '(original key, value) pairs, read from the two internal dicts side by side'
+
+    def __iter__(self):
+        return zip(self._mapping.keymap.values(), dict.values(self._mapping))
+
+
+class KeyTransform:
+    'The key transform and its optional memo, shared by TransformDict and CompactTransformDict'
+
+    __slots__ = ()
+
+    def _init_transform(self, func, cache_size: int=None) -> None:
+        self.transform_func = func
+        self.cache_size = cache_size
+        self._cached = lru_cache(maxsize=cache_size, typed=True)(func) if cache_size else None
+        # What every method calls: the bare function, or the C lru_cache wrapper itself (a Python-level
+        # wrapper would cost a method call per key). On TypeError they call _transform_failed.
+        self._transform = func if self._cached is None else self._cached
+
+    def _transform_failed(self, key):
+        '''Called in the handler of a TypeError raised by self._transform(key)
+
+        Re-raises it when it came from the transform, and transforms an
+        unhashable key, which the memo refused, without the memo.
+        '''
+        if self._cached is None or is_hashable(key):
+            raise  # the TypeError being handled
+        return self.transform_func(key)
+
+    def transform(self, key):
+        'transform_func(key), from the memo when cache_size was given'
+        try:
+            return self._transform(key)
+        except TypeError:
+            return self._transform_failed(key)
+
+    def transform_all(self, keys) -> list:
+        'The transform of every key (a list), without a Python-level call per key'
+        try:
+            return list(map(self._transform, keys))
+        except TypeError:
+            if self._cached is None or all(map(is_hashable, keys)):
+                raise  # from the transform, not the memo
+            return [self.transform(key) for key in keys]
+
+    def cache_info(self):
+        'Hits, misses, maxsize and current size of the transform memo; None without a memo'
+        return self._cached.cache_info() if self._cached is not None else None
+
+    def cache_clear(self) -> None:
+        if self._cached is not None:
+            self._cached.cache_clear()
+
+
+class TransformDict(KeyTransform, dict):
+    'dict of transform_func(key) -> value that remembers the original key of each entry'
+
+    def __init__(self, func, *args, cache_size: int=None, **kwargs):
+        self._init_transform(func, cache_size)
+        self.keymap = dict()
+        if args or kwargs:
+            self.update(*args, **kwargs)
+
+    @classmethod
+    def fromkeys(cls, func, iterable, value=None, cache_size: int=None) -> 'TransformDict':
+        'New TransformDict with keys from iterable, all set to value'
+        d = cls(func, cache_size=cache_size)
+        keys = list(iterable)
+        transformed = d.transform_all(keys)
+        d.keymap.update(zip(transformed, keys))
+        dict.update(d, dict.fromkeys(transformed, value))
+        return d
+
+    def __repr__(self):
+        items = ', '.join(f'{key!r}: {value!r}' for key, value in self.items())
+        return f'{self.__class__.__name__}({self.transform_func!r}, {{{items}}})'
+
+    def __reduce__(self):
+        # The default dict pickling would set items before transform_func is restored
+        return (partial(self.__class__, cache_size=self.cache_size), (self.transform_func, list(self.items())))
+
+    def copy(self) -> 'TransformDict':
+        return self.__class__(self.transform_func, self, cache_size=self.cache_size)
+
+    def __eq__(self, other):
+        # dict.__eq__ would compare the transformed keys; compare the original ones, as Mapping does
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    # Single-key operations: transform once, then the plain dict method. The dict methods are
+    # called through the class attributes below rather than super(), which is slower to resolve.
+
+    _getitem = dict.__getitem__
+    _setitem = dict.__setitem__
+    _contains = dict.__contains__
+    _get = dict.get
+
+    def __setitem__(self, key, value):
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        self.keymap[transformed] = key
+        self._setitem(transformed, value)
+
+    def __getitem__(self, key):
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        try:
+            return self._getitem(transformed)
+        except KeyError:
+            raise KeyError(key) from None
+
+    def getitem(self, key):
+        'untransformed key -> (original untransformed key, current value)'
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        try:
+            return (self.keymap[transformed], self._getitem(transformed))
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __delitem__(self, key):
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        try:
+            super().__delitem__(transformed)
+        except KeyError:
+            raise KeyError(key) from None
+        del self.keymap[transformed]
+
+    def __contains__(self, key):
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        return self._contains(transformed)
+
+    def get(self, key, default=None):
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        return self._get(transformed, default)
+
+    def pop(self, key, default=_missing):
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        if self._contains(transformed):
+            del self.keymap[transformed]
+            return super().pop(transformed)
+        if default is _missing:
+            raise KeyError(key)
+        return default
+
+    def popitem(self):
+        'Remove and return the last (original key, value) pair'
+        transformed, value = super().popitem()
+        return self.keymap.pop(transformed), value
+
+    def setdefault(self, key, default=None):
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        if self._contains(transformed):
+            return self._getitem(transformed)
+        self.keymap[transformed] = key
+        self._setitem(transformed, default)
+        return default
+
+    def clear(self) -> None:
+        super().clear()
+        self.keymap.clear()
+
+    # Bulk operations: transform every key in one map() call, then two dict.update calls
+
+    def update(self, other=(), **kwargs) -> None:
+        if isinstance(other, TransformDict) and other.transform_func is self.transform_func:
+            # Already transformed: copy both tables as they are
+            self.keymap.update(other.keymap)
+            super().update(dict.items(other))
+        else:
+            if not isinstance(other, dict):
+                other = dict(other)  # pairs or any mapping, at C speed; later duplicates win, as they would
+            keys, values = list(other.keys()), list(other.values())
+            transformed = self.transform_all(keys)
+            self.keymap.update(zip(transformed, keys))
+            super().update(zip(transformed, values))
+        if kwargs:
+            self.update(kwargs)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __or__(self, other):
+        if not isinstance(other, dict):
+            return NotImplemented
+        new = self.copy()
+        new.update(other)
+        return new
+
+    # Views of the original keys (keymap is kept in the same order as the dict)
+
+    def __iter__(self):
+        return iter(self.keymap.values())
+
+    def __reversed__(self):
+        return reversed(self.keymap.values())
+
+    def keys(self):
+        return KeysView(self)
+
+    def items(self):
+        return TransformItemsView(self)
+
+
+class CompactItemsView(ItemsView):
+    def __iter__(self):
+        renamed = self._mapping.renamed
+        for transformed, value in self._mapping.data.items():
+            yield renamed.get(transformed, transformed), value
+
+
+class CompactValuesView(ValuesView):
+    def __iter__(self):
+        return iter(self._mapping.data.values())
+
+
+def unchanged(key, transformed) -> bool:
+    'True when the transform left key as it was (same type and equal, e.g. a str already casefolded)'
+    return transformed is key or (type(transformed) is type(key) and transformed == key)
+
+
+class CompactTransformDict(KeyTransform, MutableMapping):
+    '''TransformDict that only stores the original keys the transform changed
+
+    TransformDict keeps keymap, transformed key -> original key, for every
+    entry. Here ``renamed`` holds only the entries whose key the transform
+    changed; the others are their own original key. For keys that are
+    already normalised (e.g. lowercase HTTP/2 header names under
+    str.casefold) renamed stays empty and an entry costs no more than in
+    a plain dict; when every key is changed it is the same size as
+    TransformDict (see bench_transform_dict.py). Same API as TransformDict.
+    '''
+
+    __slots__ = ('transform_func', 'cache_size', '_cached', '_transform', 'data', 'renamed')
+
+    def __init__(self, func, *args, cache_size: int=None, **kwargs):
+        self._init_transform(func, cache_size)
+        self.data = {}
+        self.renamed = {}
+        if args or kwargs:
+            self.update(*args, **kwargs)
+
+    @classmethod
+    def fromkeys(cls, func, iterable, value=None, cache_size: int=None) -> 'CompactTransformDict':
+        'New CompactTransformDict with keys from iterable, all set to value'
+        d = cls(func, cache_size=cache_size)
+        d.update(dict.fromkeys(iterable, value))
+        return d
+
+    def __repr__(self):
+        items = ', '.join(f'{key!r}: {value!r}' for key, value in self.items())
+        return f'{self.__class__.__name__}({self.transform_func!r}, {{{items}}})'
+
+    def __reduce__(self):
+        return (partial(self.__class__, cache_size=self.cache_size), (self.transform_func, list(self.items())))
+
+    def copy(self) -> 'CompactTransformDict':
+        d = self.__class__(self.transform_func, cache_size=self.cache_size)
+        d.data = self.data.copy()
+        d.renamed = self.renamed.copy()
+        return d
+
+    def _remember(self, key, transformed) -> None:
+        'Record the original key of an entry that was just written'
+        if not unchanged(key, transformed):
+            self.renamed[transformed] = key
+        elif self.renamed:
+            self.renamed.pop(transformed, None)  # an earlier, changed spelling of the same key
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __iter__(self):
+        renamed = self.renamed
+        if not renamed:
+            return iter(self.data)
+        return map(renamed.get, self.data, self.data)
+
+    def __setitem__(self, key, value):
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        self.data[transformed] = value
+        self._remember(key, transformed)
+
+    def __getitem__(self, key):
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        try:
+            return self.data[transformed]
+        except KeyError:
+            raise KeyError(key) from None
+
+    def getitem(self, key):
+        'untransformed key -> (original untransformed key, current value)'
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        try:
+            return (self.renamed.get(transformed, transformed), self.data[transformed])
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __delitem__(self, key):
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        try:
+            del self.data[transformed]
+        except KeyError:
+            raise KeyError(key) from None
+        self.renamed.pop(transformed, None)
+
+    def __contains__(self, key):
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        return transformed in self.data
+
+    def get(self, key, default=None):
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        return self.data.get(transformed, default)
+
+    def pop(self, key, default=_missing):
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        value = self.data.pop(transformed, _missing)
+        if value is _missing:
+            if default is _missing:
+                raise KeyError(key)
+            return default
+        self.renamed.pop(transformed, None)
+        return value
+
+    def popitem(self):
+        'Remove and return the last (original key, value) pair'
+        transformed, value = self.data.popitem()
+        return self.renamed.pop(transformed, transformed), value
+
+    def setdefault(self, key, default=None):
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        value = self.data.get(transformed, _missing)
+        if value is _missing:
+            self.data[transformed] = default
+            self._remember(key, transformed)
+            return default
+        return value
+
+    def clear(self) -> None:
+        self.data.clear()
+        self.renamed.clear()
+
+    def update(self, other=(), **kwargs) -> None:
+        'Transform every key in one map() call, then one dict.update, plus the changed keys into renamed'
+        if not isinstance(other, dict):
+            other = dict(other)
+        keys = list(other.keys())
+        transformed = self.transform_all(keys)
+        self.data.update(zip(transformed, other.values()))
+        renamed = self.renamed
+        for new, key in dict(zip(transformed, keys)).items():  # the last spelling of each key, as in data
+            if not unchanged(key, new):
+                renamed[new] = key
+            elif renamed:
+                renamed.pop(new, None)
+        if kwargs:
+            self.update(kwargs)
+
+    def keys(self):
+        return KeysView(self)
+
+    def items(self):
+        return CompactItemsView(self)
+
+    def values(self):
+        return CompactValuesView(self)
+
+
+class SnapshotItemsView(ItemsView):
+    def __iter__(self):
+        return iter(self._mapping.snapshot().values())
+
+
+class SnapshotValuesView(ValuesView):
+    def __iter__(self):
+        for key, value in self._mapping.snapshot().values():
+            yield value
+
+
+class ConcurrentTransformDict(KeyTransform, MutableMapping):
+    '''TransformDict that can be shared by threads: lock-free reads, writes under striped locks
+
+    TransformDict writes keymap and then the dict, so a thread reading in
+    between can get the new original key with the old value. Here there
+    is a single table, transformed key -> (original key, value), and
+    every write replaces a whole tuple in one dict operation: a reader
+    gets the old entry or the new one, without taking a lock.
+
+    Writers take the lock of their key's stripe (hash(transformed key)
+    modulo stripes), so writes to different keys rarely wait for each
+    other while check-then-act operations on one key (setdefault,
+    get_or_create) are atomic. The transform runs outside the locks.
+    Bulk operations (update, clear, popitem) take every stripe.
+    Iteration and the views go over a snapshot, a copy of the table taken
+    in one step, so they never fail because another thread wrote.
+
+        >>> headers = ConcurrentTransformDict(str.casefold)
+        >>> parser = headers.get_or_create('Content-Type', make_parser)   # make_parser runs once per key
+    '''
+
+    __slots__ = ('transform_func', 'cache_size', '_cached', '_transform', '_table', '_locks')
+
+    def __init__(self, func, *args, cache_size: int=None, stripes: int=16, **kwargs):
+        self._init_transform(func, cache_size)
+        self._table = {}
+        self._locks = [Lock() for i in range(stripes)]
+        if args or kwargs:
+            self.update(*args, **kwargs)
+
+    @classmethod
+    def fromkeys(cls, func, iterable, value=None, cache_size: int=None) -> 'ConcurrentTransformDict':
+        'New ConcurrentTransformDict with keys from iterable, all set to value'
+        d = cls(func, cache_size=cache_size)
+        d.update(dict.fromkeys(iterable, value))
+        return d
+
+    def __repr__(self):
+        items = ', '.join(f'{key!r}: {value!r}' for key, value in self.items())
+        return f'{self.__class__.__name__}({self.transform_func!r}, {{{items}}})'
+
+    def __reduce__(self):
+        return (partial(self.__class__, cache_size=self.cache_size, stripes=len(self._locks)),
+                (self.transform_func, list(self.items())))
+
+    def copy(self) -> 'ConcurrentTransformDict':
+        d = self.__class__(self.transform_func, cache_size=self.cache_size, stripes=len(self._locks))
+        d._table = self.snapshot()
+        return d
+
+    def snapshot(self) -> dict:
+        'Copy of the table, transformed key -> (original key, value), as of one moment'
+        return self._table.copy()
+
+    def _lock(self, transformed) -> Lock:
+        return self._locks[hash(transformed) % len(self._locks)]
+
+    @contextmanager
+    def _lock_all(self):
+        for lock in self._locks:  # always in the same order: no deadlock between two bulk writers
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in self._locks:
+                lock.release()
+
+    # Reads: one dict operation on the current table, no lock
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def __iter__(self):
+        for key, value in self.snapshot().values():
+            yield key
+
+    def __getitem__(self, key):
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        try:
+            return self._table[transformed][1]
+        except KeyError:
+            raise KeyError(key) from None
+
+    def getitem(self, key):
+        'untransformed key -> (original untransformed key, current value), both from the same write'
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        try:
+            return self._table[transformed]
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key):
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        return transformed in self._table
+
+    def get(self, key, default=None):
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        entry = self._table.get(transformed)
+        return default if entry is None else entry[1]
+
+    # Writes: under the stripe lock of the key
+
+    def __setitem__(self, key, value):
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        with self._lock(transformed):
+            self._table[transformed] = (key, value)
+
+    def __delitem__(self, key):
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        with self._lock(transformed):
+            try:
+                del self._table[transformed]
+            except KeyError:
+                raise KeyError(key) from None
+
+    def pop(self, key, default=_missing):
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        with self._lock(transformed):
+            entry = self._table.pop(transformed, None)
+        if entry is not None:
+            return entry[1]
+        if default is _missing:
+            raise KeyError(key)
+        return default
+
+    def setdefault(self, key, default=None):
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        with self._lock(transformed):
+            entry = self._table.get(transformed)
+            if entry is None:
+                self._table[transformed] = (key, default)
+                return default
+        return entry[1]
+
+    def get_or_create(self, key, factory):
+        '''The value of key; if missing, store and return factory(key)
+
+        The lookup is lock-free when the key is present. Otherwise factory
+        runs under the key's stripe lock, so it is called once per key
+        even when several threads miss at the same time.
+        '''
+        try:
+            transformed = self._transform(key)
+        except TypeError:
+            transformed = self._transform_failed(key)
+        entry = self._table.get(transformed)
+        if entry is None:
+            with self._lock(transformed):
+                entry = self._table.get(transformed)  # another thread may have created it meanwhile
+                if entry is None:
+                    entry = self._table[transformed] = (key, factory(key))
+        return entry[1]
+
+    def popitem(self):
+        'Remove and return the last (original key, value) pair'
+        with self._lock_all():
+            transformed, entry = self._table.popitem()
+        return entry
+
+    def clear(self) -> None:
+        with self._lock_all():
+            self._table.clear()
+
+    def update(self, other=(), **kwargs) -> None:
+        'Transform every key outside the locks, then one dict.update under all of them'
+        if not isinstance(other, dict):
+            other = dict(other)
+        keys = list(other.keys())
+        entries = dict(zip(self.transform_all(keys), zip(keys, other.values())))
+        with self._lock_all():
+            self._table.update(entries)
+        if kwargs:
+            self.update(kwargs)
+
+    def keys(self):
+        return KeysView(self)
+
+    def items(self):
+        return SnapshotItemsView(self)
+
+    def values(self):
+        return SnapshotValuesView(self)
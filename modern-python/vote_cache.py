@@ -0,0 +1,340 @@
+'''Binary cache of the senator x vote matrix
+
+Parsing every CSV in congress_data/ on every run is the slow part of the
+voting-block script. The parsed matrix is saved once as
+
+    b'VOTEMAT2' | header length (8 bytes, little endian) | JSON header | padding | int8 matrix
+
+The JSON header holds the senator table, the metadata of every vote and a
+manifest of the source files (mtime, size and SHA-1 of each CSV). Later
+runs memory-map the file and read rows straight out of the mapping. The
+cache is updated automatically: new CSV files are parsed and appended on
+their own, a removed or changed file rebuilds it. A file whose mtime
+changed but whose content hash didn't is not treated as a change.
+
+    >>> matrix = load_matrix('congress_data')
+    >>> result = kmeans_numpy.k_means_fit(matrix, k=3, missing=ABSENT)
+    >>> record = matrix.record()    # Dict[Senator, VoteHistory], as from load_record()
+
+Cluster the matrix with the masked distances (missing=ABSENT, or
+voting_blocks.fit): kmeans.k_means_fit would take ABSENT (-128) for a
+vote. The same goes for a warm start after the matrix grew:
+
+    >>> labels = dict(zip(matrix.senators, result.labels))
+    >>> init = warm_start_centroids(matrix, labels, k=3)      # later, on the extended matrix
+    >>> result = kmeans_numpy.k_means_fit(matrix, k=3, init=init, missing=ABSENT)
+'''
+
+from typing import Dict, List, Optional, Sequence, Tuple
+from array import array
+import json
+import mmap
+import os
+import struct
+
+from congress_loader import (ABSENT, Senator, VoteHistory, VoteInfo, VoteFile,
+                             parse_vote_files, sort_key, vote_filenames)
+from kmeans import Point, Centroid, mean
+from pointstore import PointStore
+
+MAGIC = b'VOTEMAT2'
+ALIGNMENT = 8
+
+Manifest = Dict[str, Tuple[int, int, str]]  # filename -> (mtime_ns, size, sha1)
+
+
+class VoteMatrix(PointStore):
+    'Senator x vote int8 matrix: one row (a PointStore point) per senator, one column per vote'
+
+    def __init__(self, senators: Sequence[Senator], votes: Sequence[VoteInfo], values,
+                 manifest: Optional[Manifest]=None, mapping: Optional[mmap.mmap]=None):
+        self._attach(values, len(votes))
+        self.count = len(senators)
+        self.senators = list(senators)
+        self.votes = list(votes)
+        self.manifest = manifest or {}
+        self.mapping = mapping
+
+    def __reduce__(self):
+        # An mmap can't be pickled: send a plain copy of the matrix instead
+        return (self.__class__, (self.senators, self.votes, array('b', self.view), self.manifest))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        'Release the memory mapping (rows still referenced keep it open until they are freed)'
+        if self.mapping is not None:
+            self.view.release()
+            self.values.release()
+            try:
+                self.mapping.close()
+            except BufferError:
+                pass  # a row view is still alive; the mapping closes when it is garbage collected
+            self.mapping = None
+
+    def record(self) -> Dict[Senator, VoteHistory]:
+        'senator -> tuple of votes, in vote order'
+        return {senator: tuple(row) for senator, row in zip(self.senators, self)}
+
+
+def build_matrix(vote_files: Sequence[VoteFile], manifest: Optional[Manifest]=None) -> VoteMatrix:
+    'Align the parsed files into one row per senator (in order of first appearance)'
+    rows = {}  # type: Dict[Senator, int]
+    columns = []
+    for vote_file in vote_files:
+        column = {}
+        for senator, vote in vote_file.votes:
+            column[rows.setdefault(senator, len(rows))] = vote
+        columns.append(column)
+    n_votes = len(columns)
+    values = array('b', [ABSENT]) * (len(rows) * n_votes)  # senator not in office for that vote
+    for j, column in enumerate(columns):
+        for i, vote in column.items():
+            values[i * n_votes + j] = vote
+    votes = [vote_file.info for vote_file in vote_files]
+    return VoteMatrix(list(rows), votes, values, manifest)
+
+
+def file_digest(filename: str) -> str:
+    import hashlib  # only needed when the CSV files changed
+
+    with open(filename, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def file_manifest(filenames: Sequence[str]) -> Manifest:
+    'filename -> (mtime_ns, size, sha1)'
+    manifest = {}
+    for filename in filenames:
+        stat = os.stat(filename)
+        manifest[os.path.basename(filename)] = (stat.st_mtime_ns, stat.st_size, file_digest(filename))
+    return manifest
+
+
+def changed_files(cached: Manifest, filenames: Sequence[str]) -> Tuple[List[str], List[str]]:
+    '''Compare the CSV files with the manifest the cache was built from
+
+    Returns (added, stale): files that are new, and cached files that were
+    removed or modified.
+    '''
+    current = {os.path.basename(filename): filename for filename in filenames}
+    added = [filename for name, filename in current.items() if name not in cached]
+    stale = [name for name in cached if name not in current]
+    for name, (mtime_ns, size, sha1) in cached.items():
+        if name not in current:
+            continue
+        stat = os.stat(current[name])
+        if stat.st_size != size or (stat.st_mtime_ns != mtime_ns and file_digest(current[name]) != sha1):
+            stale.append(name)
+    return added, stale
+
+
+def vote_key(info: VoteInfo) -> Tuple[str, str]:
+    'What identifies a vote column: vote ids (s20) start over every session'
+    return info.session, info.vote_id
+
+
+def extend_matrix(matrix: VoteMatrix, vote_files: Sequence[VoteFile],
+                  manifest: Optional[Manifest]=None) -> VoteMatrix:
+    '''Add the columns of newly parsed vote files to an existing matrix
+
+    Existing rows and columns are copied, not re-parsed. Columns stay in
+    vote-number order (a late file lands in its sorted place, as it would
+    in a full rebuild); new senators get a row with ABSENT for older votes.
+    '''
+    old_votes = {vote_key(info): j for j, info in enumerate(matrix.votes)}
+    new_files = {vote_key(vote_file.info): vote_file for vote_file in vote_files
+                 if vote_key(vote_file.info) not in old_votes}
+    votes = sorted(matrix.votes + [vote_file.info for vote_file in new_files.values()], key=sort_key)
+    senators = list(matrix.senators)
+    rows = {senator: i for i, senator in enumerate(senators)}
+    for vote_file in new_files.values():
+        for senator, vote in vote_file.votes:
+            if senator not in rows:
+                rows[senator] = len(senators)
+                senators.append(senator)
+
+    n_old, n_votes = len(matrix.votes), len(votes)
+    values = array('b', [ABSENT]) * (len(senators) * n_votes)
+    if list(map(vote_key, votes[:n_old])) == list(map(vote_key, matrix.votes)):
+        # Common case: the new votes all come after the cached ones, copy whole rows
+        for i, row in enumerate(matrix):
+            values[i * n_votes:i * n_votes + n_old] = array('b', row)
+    else:
+        for i, row in enumerate(matrix):
+            for j, info in enumerate(votes):
+                key = vote_key(info)
+                if key in old_votes:
+                    values[i * n_votes + j] = row[old_votes[key]]
+    for j, info in enumerate(votes):
+        key = vote_key(info)
+        if key in new_files:
+            for senator, vote in new_files[key].votes:
+                values[rows[senator] * n_votes + j] = vote
+    return VoteMatrix(senators, votes, values, manifest)
+
+
+def observed_centroid(group: Sequence[Point]) -> Centroid:
+    'Mean of each column over the rows that are not ABSENT there (0.0 when every row is)'
+    centroid = []
+    for column in zip(*group):
+        observed = [vote for vote in column if vote != ABSENT]
+        centroid.append(mean(observed) if observed else 0.0)
+    return tuple(centroid)
+
+
+def warm_start_centroids(matrix: VoteMatrix, labels: Dict[Senator, int], k: int) -> List[Centroid]:
+    '''Initial centroids for kmeans_numpy.k_means_fit(matrix, k, init=..., missing=ABSENT) after the matrix grew
+
+    Each cluster's centroid is recomputed over all columns, new ones
+    included, from the senators it held in the previous run (senator ->
+    cluster label, e.g. dict(zip(old.senators, result.labels))). ABSENT
+    cells are skipped, like kmeans_numpy with missing=ABSENT: a column is
+    the mean of the members in office for that vote, 0.0 if none were.
+    Fit with the masked distances too (or voting_blocks.fit(..., init=...)):
+    kmeans.k_means_fit would take the ABSENT cells for votes.
+    '''
+    groups = [[] for i in range(k)]  # type: List[List[Point]]
+    for senator, row in zip(matrix.senators, matrix):
+        if senator in labels:
+            groups[labels[senator]].append(row)
+    empty = [label for label, group in enumerate(groups) if not group]
+    if empty:
+        raise ValueError(f'No senator from the previous run is left in clusters {empty}')
+    return [observed_centroid(group) for group in groups]
+
+
+def save_matrix(matrix: VoteMatrix, path: str) -> None:
+    'Write the matrix atomically (a reader never sees a half-written cache)'
+    header = json.dumps({
+        'shape': [len(matrix.senators), len(matrix.votes)],
+        'senators': matrix.senators,
+        'votes': matrix.votes,
+        'manifest': matrix.manifest,
+    }).encode('utf-8')
+    prefix_length = len(MAGIC) + 8 + len(header)
+    padding = b' ' * (-prefix_length % ALIGNMENT)
+    import tempfile
+
+    # A unique temporary file in the same directory: concurrent writers never share one, and
+    # os.replace stays an atomic rename on the same file system
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with open(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<Q', len(header) + len(padding)))
+            f.write(header + padding)
+            f.write(matrix.view)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def open_matrix(path: str) -> VoteMatrix:
+    'Memory-map a saved matrix; the votes are not read until they are used'
+    with open(path, 'rb') as f:
+        prefix = f.read(len(MAGIC) + 8)
+        if len(prefix) != len(MAGIC) + 8 or not prefix.startswith(MAGIC):
+            raise ValueError(f'{path!r} is not a vote matrix cache')
+        header_length, = struct.unpack('<Q', prefix[len(MAGIC):])
+        header = json.loads(f.read(header_length))
+        offset = len(MAGIC) + 8 + header_length
+        n_senators, n_votes = header['shape']
+        size = n_senators * n_votes
+        if os.fstat(f.fileno()).st_size != offset + size:
+            # Truncated (or padded) file: the rows would come out short
+            raise ValueError(f'{path!r} does not hold the {n_senators} x {n_votes} matrix of its header')
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+    values = memoryview(mapping)[offset:offset + size].cast('b') if size else array('b')
+    senators = [Senator(*senator) for senator in header['senators']]
+    votes = [VoteInfo(*vote) for vote in header['votes']]
+    manifest = {filename: tuple(entry) for filename, entry in header['manifest'].items()}
+    return VoteMatrix(senators, votes, values, manifest, mapping)
+
+
+def try_save_matrix(matrix: VoteMatrix, path: str) -> bool:
+    'save_matrix, but a cache that cannot be written only costs the next run a rebuild'
+    try:
+        save_matrix(matrix, path)
+    except OSError:
+        return False
+    return True
+
+
+def default_cache_path(directory: str) -> str:
+    return os.path.normpath(directory) + '.votes'
+
+
+def load_matrix(directory: str='congress_data', cache: Optional[str]=None,
+                workers: Optional[int]=None) -> VoteMatrix:
+    '''Vote matrix of the CSV files in directory, from the cache when it is still current
+
+    When files were only added since the cache was written, just the new
+    files are parsed and appended (see extend_matrix); a removed or
+    modified file triggers a full rebuild. When the cache can't be written
+    (e.g. a read-only directory), the matrix is returned uncached.
+    '''
+    cache = cache or default_cache_path(directory)
+    filenames = vote_filenames(directory)
+    if not filenames:
+        raise ValueError(f'No congress_votes_*.csv files in {directory!r}')  # and no empty cache saved
+    try:
+        cached = open_matrix(cache)
+    except (OSError, ValueError):
+        cached = None  # no cache yet, or written by an older format version
+    if cached is not None:
+        added, stale = changed_files(cached.manifest, filenames)
+        if not added and not stale:
+            return cached
+        if not stale:
+            manifest = dict(cached.manifest, **file_manifest(added))
+            matrix = extend_matrix(cached, parse_vote_files(added, workers), manifest)
+            cached.close()
+            try_save_matrix(matrix, cache)
+            return matrix
+        cached.close()
+    matrix = build_matrix(parse_vote_files(filenames, workers), file_manifest(filenames))
+    try_save_matrix(matrix, cache)
+    return matrix
+
+
+if __name__ == "__main__":
+    from time import perf_counter
+
+    from congress_loader import load_record, vote_info
+    from kmeans_numpy import k_means_fit
+
+    start = perf_counter()
+    record, votes = load_record()
+    print(f'CSV parse:  {perf_counter() - start:.4f}s')
+
+    load_matrix()  # make sure the cache exists
+    start = perf_counter()
+    with load_matrix() as matrix:
+        print(f'mmap cache: {perf_counter() - start:.4f}s  {matrix!r}')
+        assert matrix.record() == record and matrix.votes == votes
+        result = k_means_fit(matrix, k=3, init='k-means++', seed=0, missing=ABSENT)
+        labels = dict(zip(matrix.senators, result.labels))
+
+    # A new roll call arrives: only that file is parsed, clustering warm-starts from the last labels
+    import shutil
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        filenames = sorted(vote_filenames(), key=lambda filename: sort_key(vote_info(filename)))
+        for filename in filenames[:-1]:
+            shutil.copy(filename, directory)
+        cache = os.path.join(directory, 'votes.cache')
+        load_matrix(directory, cache)
+        shutil.copy(filenames[-1], directory)
+        start = perf_counter()
+        with load_matrix(directory, cache) as matrix:
+            print(f'append 1:   {perf_counter() - start:.4f}s  {matrix!r}')
+            assert matrix.record() == record
+            warm = k_means_fit(matrix, k=3, init=warm_start_centroids(matrix, labels, 3), missing=ABSENT)
+            print(f'warm start converged in {warm.iterations} iterations')
@@ -0,0 +1,132 @@
+'''Agreement and Hamming distances between vote histories
+
+Votes are Yea=1, Nay=-1, Not Voting=0 (and ABSENT when the senator wasn't
+in office), so the Euclidean ``kmeans.dist`` mostly measures how often two
+senators disagree, with a sqrt and an fsum per pair. Here each history is
+packed into three Python ints used as bitsets (one bit per roll call):
+
+    yea     bit i set if the senator voted Yea on vote i
+    nay     bit i set if the senator voted Nay on vote i
+    seated  bit i set unless the vote is ABSENT
+
+so comparing two senators over every vote is a handful of ``&``, ``|``, ``^``
+and ``int.bit_count`` calls, whatever the number of votes.
+
+    >>> senators, packed = pack_record(record)
+    >>> matrix = agreement_matrix(packed)
+    >>> nearest_colleagues(senators, matrix, senators[0], n=3)
+
+``disagreement`` works on plain points, so it can also be passed as the
+metric of ``kmeans.k_means_fit`` / ``kmeans.assign_data``.
+'''
+
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+from math import fsum
+
+from congress_loader import ABSENT, Senator, VoteHistory
+from kmeans import Point
+
+PackedVotes = NamedTuple('PackedVotes', [('yea', int), ('nay', int), ('seated', int)])
+
+
+def _bits(flags) -> int:
+    'Bitset with bit i set when flags[i] is true'
+    return int(''.join('1' if flag else '0' for flag in reversed(flags)) or '0', 2)
+
+
+def pack(votes: VoteHistory) -> PackedVotes:
+    'Bit-packed Yea / Nay / seated masks of one vote history'
+    votes = list(votes)
+    return PackedVotes(_bits([vote == 1 for vote in votes]),
+                       _bits([vote == -1 for vote in votes]),
+                       _bits([vote != ABSENT for vote in votes]))
+
+
+def pack_record(record: Dict[Senator, VoteHistory]) -> Tuple[List[Senator], List[PackedVotes]]:
+    return list(record), [pack(votes) for votes in record.values()]
+
+
+def agreement(a: PackedVotes, b: PackedVotes) -> float:
+    'Fraction of the votes both senators cast (Yea or Nay) on which they voted the same way; NaN if none'
+    both = (a.yea | a.nay) & (b.yea | b.nay)
+    same = (a.yea & b.yea) | (a.nay & b.nay)
+    cast = both.bit_count()
+    return same.bit_count() / cast if cast else float('nan')
+
+
+def vote_hamming(a: PackedVotes, b: PackedVotes) -> int:
+    'Number of votes, among those both senators were seated for, with a different Yea/Nay/Not Voting'
+    return (((a.yea ^ b.yea) | (a.nay ^ b.nay)) & a.seated & b.seated).bit_count()
+
+
+def agreement_matrix(packed: Sequence[PackedVotes]) -> List[List[float]]:
+    'Senator x senator agreement rates (symmetric, 1.0 on the diagonal)'
+    n = len(packed)
+    matrix = [[1.0] * n for i in range(n)]
+    casts = [p.yea | p.nay for p in packed]
+    for i in range(n):
+        a, cast_a, row = packed[i], casts[i], matrix[i]
+        for j in range(i + 1, n):
+            b = packed[j]
+            cast = (cast_a & casts[j]).bit_count()
+            same = ((a.yea & b.yea) | (a.nay & b.nay)).bit_count()
+            row[j] = matrix[j][i] = same / cast if cast else float('nan')
+    return matrix
+
+
+def disagreement_matrix(packed: Sequence[PackedVotes]) -> List[List[float]]:
+    'Senator x senator distances 1 - agreement, e.g. for hierarchical clustering'
+    return [[1.0 - rate for rate in row] for row in agreement_matrix(packed)]
+
+
+def hamming_matrix(packed: Sequence[PackedVotes]) -> List[List[int]]:
+    'Senator x senator vote_hamming distances'
+    n = len(packed)
+    matrix = [[0] * n for i in range(n)]
+    for i in range(n):
+        for j in range(i + 1, n):
+            matrix[i][j] = matrix[j][i] = vote_hamming(packed[i], packed[j])
+    return matrix
+
+
+def nearest_colleagues(senators: Sequence[Senator], matrix: Sequence[Sequence[float]],
+                       senator: Senator, n: int=5) -> List[Tuple[Senator, float]]:
+    'The n other senators who agree most often with senator, with their agreement rates'
+    i = senators.index(senator)
+    others = [(other, rate) for j, (other, rate) in enumerate(zip(senators, matrix[i]))
+              if j != i and rate == rate]  # rate != rate for NaN: never voted together
+    return sorted(others, key=lambda pair: pair[1], reverse=True)[:n]
+
+
+def disagreement(p: Point, q: Point, zip=zip) -> float:
+    '''Expected rate of disagreement over the votes both sides cast: (1 - x*y) / 2 per vote
+
+    For two senators this is 1 - agreement(); a centroid coordinate y in
+    [-1, 1] counts as voting Yea with probability (1 + y) / 2.
+    '''
+    terms = [(1 - x * y) / 2 for x, y in zip(p, q) if x and y and x != ABSENT and y != ABSENT]
+    return fsum(terms) / len(terms) if terms else 0.0
+
+
+if __name__ == "__main__":
+    from time import perf_counter
+
+    from kmeans import k_means_fit, dist
+    from vote_cache import load_matrix
+
+    record = load_matrix().record()
+    senators, packed = pack_record(record)
+
+    start = perf_counter()
+    matrix = agreement_matrix(packed)
+    print(f'agreement matrix, bit-packed: {perf_counter() - start:.4f}s')
+    histories = list(record.values())
+    start = perf_counter()
+    [[dist(p, q) for q in histories] for p in histories]
+    print(f'dist matrix, kmeans.dist:     {perf_counter() - start:.4f}s')
+
+    for colleague, rate in nearest_colleagues(senators, matrix, senators[0], n=3):
+        print(f'{senators[0].name} agrees with {colleague.name} {rate:.0%} of the time')
+
+    result = k_means_fit(histories, k=3, init='k-means++', seed=0, metric=disagreement)
+    print(f'k-means with the disagreement metric: {result.iterations} iterations')
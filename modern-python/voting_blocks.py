@@ -0,0 +1,169 @@
+'''Command-line entry point for the voting-block analysis
+
+The same pipeline as "6 cluster analysis for voting blocks.py" (load the
+roll-call CSVs, collapse identical vote histories, weighted k-means), but
+with no work done at import time and the results streamed one cluster at
+a time:
+
+    python voting_blocks.py congress_data --k 3 --seed 0 --format jsonl
+    python voting_blocks.py congress_data --k 4 --backend numpy --format csv -o blocks.csv
+
+From Python:
+
+    >>> from voting_blocks import analyze
+    >>> for cluster in analyze('congress_data', k=3):
+    ...     print(cluster.number, cluster.parties)
+
+Every import, even typing, happens inside the functions, so importing
+this module only costs the module itself.
+'''
+
+
+class Cluster:
+    'One voting block: its number, its member senators and their party totals'
+
+    __slots__ = ('number', 'senators', 'parties')
+
+    def __init__(self, number: int, senators: list, parties: dict):
+        self.number = number
+        self.senators = senators
+        self.parties = parties
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(number={self.number}, size={len(self.senators)}, parties={self.parties})'
+
+
+backends = ('python', 'numpy', 'elkan')
+
+
+def load(directory: str, cache: bool=True, workers: int=None):
+    'senator -> vote history for the CSV files in directory, through the binary cache unless cache=False'
+    if cache:
+        from vote_cache import load_matrix
+        with load_matrix(directory, workers=workers) as matrix:
+            return matrix.record()
+    from congress_loader import load_record
+    return load_record(directory, workers)[0]
+
+
+def fit(histories, weights, k: int, seed: int=None, backend: str='python', n_init: int=10,
+        workers: int=None, init='k-means++'):
+    '''Weighted k-means with the chosen backend; absences always use the NumPy masked distances
+
+    The n_init restarts run in a process pool of workers processes;
+    workers=1 runs them in this process (no __main__ guard needed).
+    init is "k-means++", "random" or k centroids, e.g. from
+    vote_cache.warm_start_centroids: a warm start is one run, not n_init,
+    and goes through the masked distances like any data with ABSENT votes.
+    '''
+    from congress_loader import ABSENT, has_absences
+
+    if not isinstance(init, str):
+        n_init = 1  # every restart would start from the same centroids
+    kwargs = dict(k=k, init=init, seed=seed, n_init=n_init, weights=weights, workers=workers)
+    if backend == 'numpy' or has_absences(histories):
+        from kmeans_numpy import k_means_fit
+        return k_means_fit(histories, missing=ABSENT, **kwargs)
+    from kmeans import k_means_fit
+    if backend == 'elkan':
+        from kmeans_elkan import ElkanAssigner
+        return k_means_fit(histories, assign=ElkanAssigner(), **kwargs)
+    if backend != 'python':
+        raise ValueError(f'Unknown backend {backend!r}, expected one of {backends}')
+    return k_means_fit(histories, **kwargs)
+
+
+def analyze(directory: str='congress_data', k: int=3, seed: int=0, backend: str='python',
+            n_init: int=10, cache: bool=True, workers: int=None):
+    'Cluster the senators by voting record; yields one Cluster at a time'
+    from kmeans import deduplicate
+
+    record = load(directory, cache, workers)
+    senators = list(record)
+    unique_votes, counts, inverse = deduplicate(record.values())
+    result = fit(unique_votes, counts, k, seed, backend, n_init, workers)
+
+    members = [[] for i in range(k)]
+    for i, row in enumerate(inverse):
+        members[int(result.labels[row])].append(i)
+    for number, indices in enumerate(members, start=1):
+        if not indices:
+            continue
+        cluster = [senators[i] for i in indices]
+        parties = {}
+        for senator in cluster:
+            parties[senator.party] = parties.get(senator.party, 0) + 1
+        yield Cluster(number, cluster, parties)
+
+
+def write_jsonl(clusters, out) -> None:
+    'One JSON object per cluster, flushed as soon as it is written'
+    import json
+
+    for cluster in clusters:
+        json.dump({'cluster': cluster.number,
+                   'size': len(cluster.senators),
+                   'parties': cluster.parties,
+                   'senators': [senator._asdict() for senator in cluster.senators]}, out)
+        out.write('\n')
+        out.flush()
+
+
+def write_csv(clusters, out) -> None:
+    'One row per senator: cluster, name, party, state'
+    import csv
+
+    writer = csv.writer(out)
+    writer.writerow(['cluster', 'name', 'party', 'state'])
+    for cluster in clusters:
+        writer.writerows([cluster.number, *senator] for senator in cluster.senators)
+        out.flush()
+
+
+writers = {'jsonl': write_jsonl, 'csv': write_csv}
+
+
+def main(argv=None) -> None:
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Find voting blocks in the Senate roll-call CSV files')
+    parser.add_argument('directory', nargs='?', default='congress_data',
+                        help='directory of congress_votes_*.csv files (default: %(default)s)')
+    parser.add_argument('-k', '--k', type=int, default=3, help='number of clusters (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default: %(default)s)')
+    parser.add_argument('--backend', choices=backends, default='python')
+    parser.add_argument('--n-init', type=int, default=10, help='k-means restarts (default: %(default)s)')
+    parser.add_argument('--format', choices=sorted(writers), default='jsonl')
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help='parse the CSV files instead of using the binary vote cache')
+    parser.add_argument('--workers', type=int,
+                        help='processes for CSV parsing and k-means restarts (default: one per CPU)')
+    args = parser.parse_args(argv)
+    if args.k < 1:
+        parser.error(f'--k must be at least 1, not {args.k}')
+    if args.n_init < 1:
+        parser.error(f'--n-init must be at least 1, not {args.n_init}')
+    if args.workers is not None and args.workers < 1:
+        parser.error(f'--workers must be at least 1, not {args.workers}')
+    import os
+
+    from congress_loader import vote_filenames
+
+    if not os.path.isdir(args.directory):
+        parser.error(f'{args.directory!r} is not a directory')
+    if not vote_filenames(args.directory):
+        parser.error(f'no congress_votes_*.csv files in {args.directory!r}')
+
+    clusters = analyze(args.directory, args.k, args.seed, args.backend, args.n_init, args.cache, args.workers)
+    write = writers[args.format]
+    if args.output:
+        with open(args.output, 'w', newline='', encoding='utf-8') as out:
+            write(clusters, out)
+    else:
+        write(clusters, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()